@@ -8,3 +8,24 @@ from pkgutil import extend_path
 __path__ = extend_path(__path__, __name__)
 
 __version__ = '2.1.0'
+
+from baiji.serialization.batch import load_many, dump_many # pylint: disable=wrong-import-position
+
+
+def load(path, format=None, **kwargs): # pylint: disable=redefined-builtin
+    '''
+    Load path with the format module matching its extension, such as
+    baiji.serialization.json for `.json` or `.json.gz`, or with the module
+    for format. The remaining arguments are passed to its load.
+    '''
+    from baiji.serialization.util.formatlib import module_for_path
+    return module_for_path(path, format).load(path, **kwargs)
+
+
+def dump(obj, path, format=None, **kwargs): # pylint: disable=redefined-builtin
+    '''
+    Dump obj to path with the format module matching its extension, or with
+    the module for format. The remaining arguments are passed to its dump.
+    '''
+    from baiji.serialization.util.formatlib import module_for_path
+    return module_for_path(path, format).dump(obj, path, **kwargs)
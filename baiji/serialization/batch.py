@@ -0,0 +1,122 @@
+from __future__ import absolute_import
+
+__all__ = ['load_many', 'dump_many']
+
+DEFAULT_THREADS = 16
+
+
+def load_many(paths, format=None, threads=DEFAULT_THREADS, processes=None, ordered=True, errors='raise', **kwargs): # pylint: disable=redefined-builtin
+    '''
+    Load many files concurrently, each with the module matching its
+    extension, or with the module for format.
+
+    threads: The number of files to read at once.
+    processes: When given, files are read in threads but decoded in a pool
+      of this many processes, which helps when decoding is CPU bound.
+      Keyword arguments are sent to the workers, so must be picklable.
+    ordered: When True, return a list of the results in the order of
+      paths. When False, return a generator which yields (path, result)
+      pairs as each load completes.
+    errors: 'raise' to raise the first error encountered, or 'return' to
+      put the exception in place of a file's result and carry on.
+
+    The remaining keyword arguments are passed to each load.
+    '''
+    paths = list(paths)
+    if errors not in ('raise', 'return'):
+        raise ValueError("errors should be 'raise' or 'return'")
+    results = _run(_load_one, [(path, format, kwargs) for path in paths], threads, processes)
+    if ordered:
+        ordered_results = [None] * len(paths)
+        for index, result in results:
+            ordered_results[index] = _check(result, errors)
+        return ordered_results
+    return ((paths[index], _check(result, errors)) for index, result in results)
+
+
+def dump_many(objs_by_path, format=None, threads=DEFAULT_THREADS, errors='raise', **kwargs): # pylint: disable=redefined-builtin
+    '''
+    Dump many objects concurrently. objs_by_path is a dict mapping each
+    path to the object to write there, with the module matching its
+    extension, or with the module for format.
+
+    errors: 'raise' to raise the first error encountered, or 'return' to
+      carry on and return a dict mapping the paths which failed to their
+      exceptions.
+
+    The remaining keyword arguments are passed to each dump.
+    '''
+    if errors not in ('raise', 'return'):
+        raise ValueError("errors should be 'raise' or 'return'")
+    tasks = [(path, obj, format, kwargs) for path, obj in objs_by_path.iteritems()]
+    failures = {}
+    for index, result in _run(_dump_one, tasks, threads, None):
+        if isinstance(result, _Failure):
+            _check(result, errors)
+            failures[tasks[index][0]] = result.error
+    if errors == 'return':
+        return failures
+
+
+class _Failure(object):
+    def __init__(self, error):
+        self.error = error
+
+
+def _check(result, errors):
+    if isinstance(result, _Failure):
+        if errors == 'raise':
+            raise result.error
+        return result.error
+    return result
+
+
+def _run(fn, tasks, threads, processes):
+    '''
+    Yield (index, result) pairs as the calls fn(task, decode_pool) complete.
+    Errors are caught and returned as _Failure instances.
+    '''
+    from multiprocessing import Pool
+    from multiprocessing.pool import ThreadPool
+
+    def call(index):
+        try:
+            return index, fn(tasks[index], decode_pool)
+        except Exception as e: # pylint: disable=broad-except
+            return index, _Failure(e)
+
+    decode_pool = Pool(processes) if processes else None
+    pool = ThreadPool(max(1, min(threads, len(tasks))))
+    try:
+        for index, result in pool.imap_unordered(call, range(len(tasks))):
+            yield index, result
+        pool.close()
+        if decode_pool is not None:
+            decode_pool.close()
+    finally:
+        pool.terminate()
+        if decode_pool is not None:
+            decode_pool.terminate()
+
+
+def _load_one(task, decode_pool):
+    from baiji.serialization.util.formatlib import module_for_path
+    from baiji.serialization.util.openlib import ensure_file_open_and_call
+    path, format, kwargs = task # pylint: disable=redefined-builtin
+    module = module_for_path(path, format)
+    if decode_pool is None:
+        return module.load(path, **kwargs)
+    data = ensure_file_open_and_call(path, lambda f: f.read(), 'rb')
+    return decode_pool.apply(_decode, (module.__name__, data, kwargs))
+
+
+def _decode(module_name, data, kwargs):
+    from StringIO import StringIO
+    from baiji.serialization.util.importlib import module_from_str
+    return module_from_str(module_name).load(StringIO(data), **kwargs)
+
+
+def _dump_one(task, decode_pool): # pylint: disable=unused-argument
+    from baiji.serialization.util.formatlib import module_for_path
+    path, obj, format, kwargs = task # pylint: disable=redefined-builtin
+    return module_for_path(path, format).dump(obj, path, **kwargs)
@@ -0,0 +1,348 @@
+from __future__ import absolute_import
+
+# A compact binary equivalent of baiji.serialization.json. Values are
+# type-tagged, numeric ndarrays are stored as aligned frames of raw bytes,
+# and everything else goes through the same JSONEncoder and JSONDecoder
+# extension points, so anything json can write, bjson can write.
+#
+# Unlike pickle, loading a file never calls anything but the decoder. The
+# default decoder has no base_path, so it rejects the blob references which
+# json follows, and never reads any other file. With it, untrusted input is
+# safe to read.
+#
+# The file is MAGIC followed by one value. Each value is a tag byte and
+# then, in little-endian order:
+#
+#     N, T, F          None, True, False
+#     i                an int64
+#     L                an integer too large for an int64, as a str value
+#     d                a float64
+#     s, u             a uint32 length, then the bytes of a str, or the
+#                      UTF-8 bytes of a unicode
+#     l                a uint32 count, then that many values
+#     m                a uint32 count, then that many key and value pairs
+#     a                an ndarray: a uint8 length and then the dtype's str,
+#                      its order (C or F), a uint8 ndim, an int64 for each
+#                      dimension, zero padding to the next multiple of
+#                      FRAME_ALIGNMENT from the start of the file, and the
+#                      array's bytes
+#
+# Decoded arrays are views of the buffer the file was read into, so
+# they're never copied. That buffer is filled in place, or memory mapped,
+# so the file isn't held in memory twice while loading.
+
+__all__ = ['load', 'aload', 'adump', 'loads', 'dump', 'dumps', 'EXTENSION']
+
+EXTENSION = '.bjson'
+MAGIC = '\x89BJSON\r\n'
+FRAME_ALIGNMENT = 64
+
+
+def dump(obj, f, **kwargs):
+    '''
+    encoder: A JSONEncoder, or a subclass instance, which encodes objects
+      other than the builtin types and numeric ndarrays, as it does for json.
+    '''
+    from baiji.serialization.util.openlib import ensure_file_open_and_call
+    return ensure_file_open_and_call(f, _dump, 'wb', obj, **kwargs)
+
+
+def adump(obj, f, *args, **kwargs):
+    '''
+    Like dump, but run in the background and return a Future. See
+    baiji.serialization.util.asynclib.
+    '''
+    from baiji.serialization.util.asynclib import submit
+    return submit(dump, obj, f, *args, **kwargs)
+
+
+def dumps(obj, **kwargs):
+    from cStringIO import StringIO
+    output = StringIO()
+    _dump(output, obj, **kwargs)
+    return output.getvalue()
+
+
+def load(f, **kwargs):
+    '''
+    decoder: A JSONDecoder, or a subclass instance, which is called with
+      each decoded dict, as it is for json.
+    '''
+    from baiji.serialization.util.openlib import ensure_file_open_and_call
+    return ensure_file_open_and_call(f, _load, 'rb', **kwargs)
+
+
+def aload(f, *args, **kwargs):
+    '''
+    Like load, but run in the background and return a Future. See
+    baiji.serialization.util.asynclib.
+    '''
+    from baiji.serialization.util.asynclib import submit
+    return submit(load, f, *args, **kwargs)
+
+
+def loads(s, **kwargs):
+    return _decode(bytearray(s), **kwargs)
+
+
+def _dump(f, obj, encoder=None):
+    from baiji.serialization.json import JSONEncoder
+    f.write(MAGIC)
+    writer = _Writer(f, encoder if encoder is not None else JSONEncoder())
+    writer.write_value(obj)
+    writer.flush()
+
+
+def _load(f, decoder=None):
+    return _decode(_read_buffer(f), decoder=decoder)
+
+
+def _read_buffer(f):
+    '''
+    Return the rest of f as a mutable buffer, which decoded arrays share.
+
+    When the size of the rest of f is known, it's read straight into a
+    bytearray of that size, or if f can't readinto, memory mapped copy on
+    write as an array of uint8. Otherwise, like compressed files, it's read
+    and then copied.
+    '''
+    try:
+        start = f.tell()
+        f.seek(0, 2)
+        size = f.tell() - start
+        f.seek(start)
+    except (AttributeError, IOError, ValueError):
+        return bytearray(f.read())
+    if hasattr(f, 'readinto'):
+        buf = bytearray(size)
+        view = memoryview(buf)
+        filled = 0
+        while filled < size:
+            count = f.readinto(view[filled:])
+            if not count:
+                break
+            filled += count
+        del view
+        del buf[filled:]
+        # In case the file grew
+        buf.extend(f.read())
+        return buf
+    try:
+        fileno = f.fileno()
+    except (AttributeError, IOError, ValueError):
+        return bytearray(f.read())
+    import mmap
+    import numpy as np
+    if not size:
+        return bytearray()
+    # Offsets must be page aligned, so map the whole file
+    mapped = mmap.mmap(fileno, start + size, access=mmap.ACCESS_COPY)
+    f.seek(start + size)
+    return np.frombuffer(mapped, dtype=np.uint8)[start:]
+
+
+def _decode(buf, decoder=None):
+    import struct
+    from baiji.serialization.json import JSONDecoder
+    if str(buffer(buf, 0, len(MAGIC))) != MAGIC:
+        raise ValueError('Not a bjson file')
+    reader = _Reader(buf, decoder if decoder is not None else JSONDecoder())
+    reader.position = len(MAGIC)
+    try:
+        result = reader.read_value()
+    except (IndexError, struct.error):
+        raise ValueError('Truncated bjson data')
+    if reader.position != len(buf):
+        raise ValueError('Extra data after the bjson value, at byte {}'.format(reader.position))
+    return result
+
+
+class _Writer(object):
+    def __init__(self, f, encoder):
+        import sys
+        import struct
+        self.f = f
+        self.encoder = encoder
+        self.position = len(MAGIC)
+        self.chunks = []
+        self.int64 = struct.Struct('<q')
+        self.float64 = struct.Struct('<d')
+        self.uint32 = struct.Struct('<I')
+        self.writers = {
+            type(None): lambda obj: self.write('N'),
+            bool: lambda obj: self.write('T' if obj else 'F'),
+            int: self.write_int,
+            long: self.write_int,
+            float: self.write_float,
+            str: self.write_str,
+            unicode: self.write_unicode,
+            list: self.write_list,
+            tuple: self.write_list,
+            dict: self.write_dict,
+        }
+        # If numpy hasn't been imported, there can't be any arrays to write
+        self.np = sys.modules.get('numpy')
+        if self.np is not None:
+            self.writers[self.np.ndarray] = self.write_ndarray
+
+    def write(self, data):
+        # Small writes are buffered, and flushed before each array
+        self.chunks.append(data)
+        self.position += len(data)
+
+    def flush(self):
+        self.f.write(''.join(self.chunks))
+        self.chunks = []
+
+    def write_value(self, obj):
+        writer = self.writers.get(type(obj))
+        if writer is None:
+            writer = self.write_other
+        writer(obj)
+
+    def write_other(self, obj):
+        # The same order simplejson tries, for subclasses and the rest
+        if isinstance(obj, bool):
+            self.write('T' if obj else 'F')
+        elif isinstance(obj, (int, long)):
+            self.write_int(obj)
+        elif isinstance(obj, float):
+            self.write_float(float(obj))
+        elif isinstance(obj, str):
+            self.write_str(obj)
+        elif isinstance(obj, unicode):
+            self.write_unicode(obj)
+        elif self.np is not None and isinstance(obj, self.np.ndarray) and obj.dtype.kind in 'biufc':
+            self.write_ndarray(obj)
+        elif hasattr(obj, 'for_json'):
+            self.write_value(obj.for_json())
+        elif isinstance(obj, (list, tuple)):
+            self.write_list(obj)
+        elif isinstance(obj, dict):
+            self.write_dict(obj)
+        else:
+            encoded = self.encoder(obj)
+            if encoded is obj:
+                raise TypeError('{!r} is not bjson serializable'.format(obj))
+            self.write_value(encoded)
+
+    def write_int(self, obj):
+        if -2 ** 63 <= obj < 2 ** 63:
+            self.write('i' + self.int64.pack(obj))
+        else:
+            self.write('L')
+            self.write_str(str(obj))
+
+    def write_float(self, obj):
+        self.write('d' + self.float64.pack(obj))
+
+    def write_str(self, obj):
+        self.write('s' + self.uint32.pack(len(obj)) + obj)
+
+    def write_unicode(self, obj):
+        data = obj.encode('utf-8')
+        self.write('u' + self.uint32.pack(len(data)) + data)
+
+    def write_list(self, obj):
+        self.write('l' + self.uint32.pack(len(obj)))
+        for item in obj:
+            self.write_value(item)
+
+    def write_dict(self, obj):
+        self.write('m' + self.uint32.pack(len(obj)))
+        for key, value in obj.iteritems():
+            if not isinstance(key, (basestring, int, long, float, type(None))):
+                raise TypeError('bjson keys must be strings or numbers, not {!r}'.format(key))
+            self.write_value(key)
+            self.write_value(value)
+
+    def write_ndarray(self, obj):
+        if obj.dtype.kind not in 'biufc':
+            # Object arrays and the like are left to the encoder
+            return self.write_value(self.encoder(obj))
+        order = 'F' if obj.flags.f_contiguous and not obj.flags.c_contiguous else 'C'
+        obj = self.np.asarray(obj, order=order)
+        dtype = obj.dtype.str
+        header = ['a', chr(len(dtype)), dtype, order, chr(obj.ndim)]
+        header.extend(self.int64.pack(n) for n in obj.shape)
+        self.write(''.join(header))
+        self.write('\0' * (-self.position % FRAME_ALIGNMENT))
+        self.flush()
+        self.f.write(buffer(obj)) # Without a copy, since it's contiguous
+        self.position += obj.nbytes
+
+
+class _Reader(object):
+    def __init__(self, buf, decoder):
+        import struct
+        self.buf = buf
+        self.decoder = decoder
+        self.position = 0
+        self.int64 = struct.Struct('<q')
+        self.float64 = struct.Struct('<d')
+        self.uint32 = struct.Struct('<I')
+        self.readers = {
+            ord('N'): lambda: None,
+            ord('T'): lambda: True,
+            ord('F'): lambda: False,
+            ord('i'): lambda: self.read_struct(self.int64),
+            ord('L'): lambda: long(self.read_value()),
+            ord('d'): lambda: self.read_struct(self.float64),
+            ord('s'): self.read_str,
+            ord('u'): lambda: self.read_str().decode('utf-8'),
+            ord('l'): self.read_list,
+            ord('m'): self.read_dict,
+            ord('a'): self.read_ndarray,
+        }
+
+    def read(self, size):
+        start = self.position
+        self.position += size
+        if self.position > len(self.buf):
+            raise ValueError('Truncated bjson data')
+        return str(buffer(self.buf, start, size))
+
+    def read_struct(self, fmt):
+        # Raises struct.error past the end, which _decode reports
+        value, = fmt.unpack_from(self.buf, self.position)
+        self.position += fmt.size
+        return value
+
+    def read_value(self):
+        # Raises IndexError past the end, which _decode reports
+        tag = self.buf[self.position]
+        self.position += 1
+        reader = self.readers.get(tag)
+        if reader is None:
+            raise ValueError('Unknown bjson tag {!r} at byte {}'.format(chr(tag), self.position - 1))
+        return reader()
+
+    def read_str(self):
+        return self.read(self.read_struct(self.uint32))
+
+    def read_list(self):
+        return [self.read_value() for _ in xrange(self.read_struct(self.uint32))]
+
+    def read_dict(self):
+        result = {}
+        for _ in xrange(self.read_struct(self.uint32)):
+            key = self.read_value()
+            result[key] = self.read_value()
+        return self.decoder(result)
+
+    def read_ndarray(self):
+        import numpy as np
+        dtype = np.dtype(self.read(self.buf[self.position] + 1)[1:])
+        order = chr(self.buf[self.position])
+        ndim = self.buf[self.position + 1]
+        self.position += 2
+        shape = tuple(self.read_struct(self.int64) for _ in xrange(ndim))
+        self.position += -self.position % FRAME_ALIGNMENT
+        count = int(np.prod(shape))
+        if not count:
+            return np.empty(shape, dtype=dtype, order=order)
+        if self.position + count * dtype.itemsize > len(self.buf):
+            raise ValueError('Truncated bjson data')
+        arr = np.frombuffer(self.buf, dtype=dtype, count=count, offset=self.position)
+        self.position += count * dtype.itemsize
+        return arr.reshape(shape, order=order)
@@ -1,18 +1,55 @@
 from __future__ import absolute_import
 
-__all__ = ['load', 'dump', 'dumps', 'EXTENSION']
+__all__ = ['load', 'aload', 'adump', 'iterload', 'dump', 'dump_iter', 'dumps', 'EXTENSION']
 
 EXTENSION = '.csv'
 
+# The number of rows converted to arrays at a time by a columnar load
+COLUMNAR_BATCH_SIZE = 16 * 1024
+
 
 def load(f, *args, **kwargs):
     from baiji.serialization.util.openlib import ensure_file_open_and_call
     return ensure_file_open_and_call(f, _load, mode='rb', *args, **kwargs)
 
 
-def dump(obj, f):
+def aload(f, *args, **kwargs):
+    '''
+    Like load, but run in the background and return a Future. See
+    baiji.serialization.util.asynclib.
+    '''
+    from baiji.serialization.util.asynclib import submit
+    return submit(load, f, *args, **kwargs)
+
+
+def iterload(f, *args, **kwargs):
+    '''
+    Like load, but yield the rows one at a time instead of returning a list,
+    so the whole file is never held in memory.
+    '''
+    from baiji.serialization.util.openlib import ensure_file_open_and_iterate
+    return ensure_file_open_and_iterate(f, _iterload, 'rb', *args, **kwargs)
+
+
+def dump(obj, f, compression=None):
+    from baiji.serialization.util.openlib import ensure_file_open_and_call
+    return ensure_file_open_and_call(f, _dump, mode='wb', obj=obj, compression=compression)
+
+def adump(obj, f, *args, **kwargs):
+    '''
+    Like dump, but run in the background and return a Future. See
+    baiji.serialization.util.asynclib.
+    '''
+    from baiji.serialization.util.asynclib import submit
+    return submit(dump, obj, f, *args, **kwargs)
+
+def dump_iter(rows, f, compression=None):
+    '''
+    Like dump, but rows may be any iterable of lists or tuples, such as a
+    generator. Each row is checked and written as it's produced.
+    '''
     from baiji.serialization.util.openlib import ensure_file_open_and_call
-    return ensure_file_open_and_call(f, _dump, mode='wb', obj=obj)
+    return ensure_file_open_and_call(f, _dump_iter, mode='wb', rows=rows, compression=compression)
 
 def dumps(obj):
     import StringIO
@@ -22,38 +59,93 @@ def dumps(obj):
     output.close()
     return out_string
 
-def _load(f, header_row=True, header_row_transformer=lambda x: x):
+def _load(f, header_row=True, header_row_transformer=lambda x: x, columnar=False, dtypes=None):
     '''
     header_row_transformer: Give the caller a chance to rewrite the header row.
       Accepts one argument, a sequence of field names, and should return a
       modified sequence.
+    columnar: Instead of a list of dicts, return a dict mapping each field
+      name (or column index, when there's no header row) to a numpy array of
+      the values in that column.
+    dtypes: When columnar, a dict mapping field names to the dtype each
+      column should be converted to. Other columns are left as strings.
 
     '''
-    import csv
+    if columnar:
+        return _load_columns(f, header_row, header_row_transformer, dtypes or {})
+    return list(_iterload(f, header_row, header_row_transformer))
 
-    reader = csv.reader(f)
-    line_number = 1
-    result = []
 
-    if header_row:
-        field_names = next(reader)
-        field_names = header_row_transformer(field_names)
-        line_number += 1
+def _iterload(f, header_row=True, header_row_transformer=lambda x: x):
+    from itertools import izip
+
+    field_names, rows = _read_rows(f, header_row, header_row_transformer)
+    if field_names is None:
+        for row_values in rows:
+            yield dict(enumerate(row_values))
+    else:
+        for row_values in rows:
+            yield dict(izip(field_names, row_values))
+
+
+def _load_columns(f, header_row, header_row_transformer, dtypes):
+    import numpy as np
+    from itertools import chain, islice, izip
+
+    field_names, rows = _read_rows(f, header_row, header_row_transformer)
+    if field_names is None:
+        first_row = next(rows, None)
+        if first_row is None:
+            return {}
+        field_names = range(len(first_row))
+        rows = _check_rows(chain([first_row], rows), len(first_row), 'Line 1', 1)
+
+    # Convert a batch of rows at a time, so the rows are never all held in
+    # memory at once
+    chunks = [[] for _ in field_names]
+    while True:
+        batch = list(islice(rows, COLUMNAR_BATCH_SIZE))
+        if not batch:
+            break
+        for name, column, column_chunks in izip(field_names, izip(*batch), chunks):
+            column_chunks.append(np.array(column, dtype=dtypes.get(name)))
+        del batch
+    result = {}
+    for name, column_chunks in izip(field_names, chunks):
+        if not column_chunks:
+            result[name] = np.array((), dtype=dtypes.get(name))
+        elif len(column_chunks) == 1:
+            result[name] = column_chunks[0]
+        else:
+            result[name] = np.concatenate(column_chunks)
+        # Release the chunks as each column is joined
+        del column_chunks[:]
+    return result
 
-        for row_values in reader:
-            if len(row_values) != len(field_names):
-                raise ValueError("Header row contains %s items but line %s contains %s" % \
-                    (len(field_names), line_number, len(row_values)))
 
-            result.append({k: v for k, v in zip(field_names, row_values)})
-            line_number += 1
+def _read_rows(f, header_row, header_row_transformer):
+    '''
+    Return the field names, or None when there's no header row, and an
+    iterator over the remaining rows, which checks each of them against the
+    header.
 
-    else:
-        for row_values in reader:
-            result.append({i: v for i, v in enumerate(row_values)})
-            line_number += 1
+    '''
+    import csv
 
-    return result
+    reader = csv.reader(f)
+    if not header_row:
+        return None, reader
+    field_names = tuple(header_row_transformer(next(reader, [])))
+    return field_names, _check_rows(reader, len(field_names), 'Header row', 2)
+
+
+def _check_rows(rows, num_fields, expected_from, line_number):
+    for row_values in rows:
+        if len(row_values) != num_fields:
+            raise ValueError("%s contains %s items but line %s contains %s" % \
+                (expected_from, num_fields, line_number, len(row_values)))
+        yield row_values
+        line_number += 1
 
 
 def _dump(f, obj):
@@ -80,6 +172,15 @@ def _dump(f, obj):
         writer.writerow(item)
 
 
+def _dump_iter(f, rows):
+    import csv
+    writer = csv.writer(f)
+    for row in rows:
+        if not isinstance(row, (list, tuple)):
+            raise ValueError('rows should be lists or tuples')
+        writer.writerow(row)
+
+
 class CSVSerializer(object):
     '''
     Simple CSV serializer. Subclasses can support serializing arrays of
@@ -97,11 +198,22 @@ class CSVSerializer(object):
             return self.format(self._data)
         else:
             return self._data
+    def iter_body(self):
+        '''
+        Subclasses can override this to produce the body rows lazily.
+        '''
+        return iter(self.body)
     def render(self):
         return self.header + self.body
     def dump(self, f):
-        # Delegate to baiji.serialization.csv.dump()
-        dump(self.render(), f)
+        # Delegate to baiji.serialization.csv.dump_iter(), so the rows are
+        # written as they're produced. Subclasses which override render get
+        # the rows it returns.
+        from itertools import chain
+        if type(self).render.__func__ is not CSVSerializer.render.__func__:
+            dump_iter(self.render(), f)
+        else:
+            dump_iter(chain(self.header, self.iter_body()), f)
 
 
 class CSVCollectionSerializer(CSVSerializer):
@@ -109,6 +221,10 @@ class CSVCollectionSerializer(CSVSerializer):
     Serialize to CSV from a collection of dicts. Dicts should have the
     same keys, which become the column headings.
 
+    The collection may also be any other iterable of dicts, such as a
+    generator, which is consumed as it's dumped. The keys are taken from
+    the first item, and the rest are checked as they're written.
+
     '''
     def __init__(self, collection, row_ordering=None):
         '''
@@ -116,8 +232,20 @@ class CSVCollectionSerializer(CSVSerializer):
           of keys specifying the order in which to emit the items.
 
         '''
+        if isinstance(collection, (dict, list)):
+            self.keys = self.compute_keys(collection)
+            self.check_rows = False
+        else:
+            from itertools import chain
+            collection = iter(collection)
+            try:
+                first_value = next(collection)
+            except StopIteration:
+                raise ValueError('Collection is empty')
+            self.keys = sorted(first_value.keys())
+            self.check_rows = True
+            collection = chain([first_value], collection)
         super(CSVCollectionSerializer, self).__init__(collection)
-        self.keys = self.compute_keys(collection)
         if isinstance(collection, dict):
             self.header = [[''] + self.keys]
         else:
@@ -128,42 +256,47 @@ class CSVCollectionSerializer(CSVSerializer):
     def compute_keys(cls, collection):
         if isinstance(collection, dict):
             first_value = next(collection.itervalues())
+            keyed_items = collection.iteritems()
         else:
             first_value = collection[0]
+            keyed_items = enumerate(collection)
         result = sorted(first_value.keys())
 
         # Make sure the keys are consistent.
-        if isinstance(collection, dict):
-            keyed_collection = collection
-        else:
-            keyed_collection = {index: value for index, value in enumerate(collection)}
-
         expected = set(result)
-        for key, item in keyed_collection.iteritems():
-            if set(item.keys()) != expected:
-                message = 'Item %s had different keys (got %s, expected %s)' % \
-                    (key, ' '.join(item.keys()), ' '.join(expected))
-                raise ValueError(message)
+        for key, item in keyed_items:
+            cls.check_keys(key, item, expected)
 
         return result
 
+    @staticmethod
+    def check_keys(key, item, expected):
+        if set(item.keys()) != expected:
+            message = 'Item %s had different keys (got %s, expected %s)' % \
+                (key, ' '.join(item.keys()), ' '.join(expected))
+            raise ValueError(message)
+
     def format(self, collection):
+        return list(self.iter_format(collection))
+
+    def iter_format(self, collection):
         if isinstance(collection, dict):
             if self.row_ordering is not None:
                 row_ordering = self.row_ordering
             else:
                 row_ordering = collection.keys()
-            row_heads = [[key] for key in row_ordering]
-            rows = [collection[key] for key in row_ordering]
+            for key in row_ordering:
+                row = collection[key]
+                yield [key] + [row[k] for k in self.keys]
         else:
-            row_heads = [[] for _ in range(len(collection))]
-            rows = collection
-
-        return [
-            row_head +
-            [
-                row[k]
-                for k in self.keys
-            ]
-            for row_head, row in zip(row_heads, rows)
-        ]
+            expected = set(self.keys) if self.check_rows else None
+            for index, row in enumerate(collection):
+                if expected is not None:
+                    self.check_keys(index, row, expected)
+                yield [row[k] for k in self.keys]
+
+    def iter_body(self):
+        # Subclasses which override format get the rows it returns.
+        if type(self).format.__func__ is not CSVCollectionSerializer.format.__func__:
+            return super(CSVCollectionSerializer, self).iter_body()
+        return self.iter_format(self._data)
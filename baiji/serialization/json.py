@@ -1,56 +1,388 @@
 from __future__ import absolute_import
 import simplejson as json
+from baiji.serialization.util import instrumentation
 
 EXTENSION = '.json'
 ENCODE_PRIMITIVES_BY_DEFAULT = False
+ENCODE_BINARY_BY_DEFAULT = False
+
+BLOB_EXTENSION = '.blob'
+BLOB_ALIGNMENT = 64
+ITERLOAD_CHUNK_SIZE = 64 * 1024
+
+# scipy.sparse formats which are stored as data, indices and indptr
+SPARSE_COMPRESSED_FORMATS = ('csr', 'csc', 'bsr')
 
 def dump(obj, f, *args, **kwargs):
+    '''
+    blob_threshold: When given, numeric arrays of at least this many bytes are
+      written to a binary sidecar file next to `f`, named by appending
+      BLOB_EXTENSION, and the JSON keeps only a reference to them. This
+      requires `f` to be a path. The sidecar is only created when at least
+      one array is written to it.
+    '''
+    return _dump_with_blob(f, _dump, obj, args, kwargs)
+
+def _dump_with_blob(f, fn, obj, args, kwargs):
     from baiji.serialization.util.openlib import ensure_file_open_and_call
-    return ensure_file_open_and_call(f, _dump, 'w', obj, *args, **kwargs)
+    blob_threshold = kwargs.pop('blob_threshold', None)
+    if blob_threshold is None:
+        return ensure_file_open_and_call(f, fn, 'w', obj, *args, **kwargs)
+    if not isinstance(f, basestring):
+        raise ValueError('blob_threshold requires a path, not a file object')
+    # _dump_args sets the writer on the encoder, which may be the caller's,
+    # so put back what it had once the file is written
+    encoder = kwargs.get('encoder')
+    previous = getattr(encoder, 'blob', None)
+    with BlobWriter(f + BLOB_EXTENSION, blob_threshold) as blob:
+        kwargs['blob'] = blob
+        try:
+            return ensure_file_open_and_call(f, fn, 'w', obj, *args, **kwargs)
+        finally:
+            if encoder is not None:
+                encoder.blob = previous
+
+def adump(obj, f, *args, **kwargs):
+    '''
+    Like dump, but run in the background and return a Future. See
+    baiji.serialization.util.asynclib.
+    '''
+    from baiji.serialization.util.asynclib import submit
+    return submit(dump, obj, f, *args, **kwargs)
+
 
 def dumps(*args, **kwargs):
     return json.dumps(*args, **_dump_args(kwargs))
 
+def dump_iter(iterable, f, **kwargs):
+    '''
+    Write the items of iterable, such as a generator, as a JSON array.
+    Each item is encoded and written as soon as it's produced, so the whole
+    sequence is never held in memory. Accepts the same keyword arguments as
+    dump, including indent and blob_threshold, and writes the same JSON.
+    '''
+    return _dump_with_blob(f, _dump_iter, iterable, (), kwargs)
+
+def _dump_iter(f, iterable, **kwargs):
+    cls = kwargs.pop('cls', None) or json.JSONEncoder
+    indent = kwargs.get('indent')
+    separators = kwargs.get('separators')
+    if separators is not None:
+        item_separator = separators[0]
+    elif indent is not None:
+        item_separator = ','
+    else:
+        item_separator = ', '
+    if indent is None:
+        newline_indent = ''
+    else:
+        if not isinstance(indent, basestring):
+            indent = ' ' * indent
+        # Encoded items are indented one level deeper, inside the array.
+        # Strings in JSON can't contain a newline, so each one in an item
+        # starts a line of its own.
+        newline_indent = '\n' + indent
+    encoder = cls(**_dump_args(kwargs))
+    f.write('[')
+    empty = True
+    for item in iterable:
+        if not empty:
+            f.write(item_separator)
+        encoded = encoder.encode(item)
+        if newline_indent:
+            encoded = newline_indent + encoded.replace('\n', newline_indent)
+        f.write(encoded)
+        empty = False
+    if not empty and newline_indent:
+        f.write('\n')
+    f.write(']')
+
 def _dump(f, obj, *args, **kwargs):
     return json.dump(obj, f, *args, **_dump_args(kwargs))
 
 def load(f, *args, **kwargs):
+    '''
+    base_path: The path that references to external array data are resolved
+      against. Defaults to `f` when it is a path.
+    mmap: When True, arrays stored in a local blob file are returned as
+      read-only np.memmap views instead of being read into memory. Arrays in
+      remote blobs are mapped from the local copy when util.cache is
+      enabled, and are otherwise read eagerly.
+    '''
     from baiji.serialization.util.openlib import ensure_file_open_and_call
+    if isinstance(f, basestring):
+        kwargs.setdefault('base_path', f)
     return ensure_file_open_and_call(f, _load, 'r', *args, **kwargs)
 
+def aload(f, *args, **kwargs):
+    '''
+    Like load, but run in the background and return a Future. See
+    baiji.serialization.util.asynclib.
+    '''
+    from baiji.serialization.util.asynclib import submit
+    return submit(load, f, *args, **kwargs)
+
+
 def _load(f, *args, **kwargs):
-    return json.load(f, *args, **_load_args(kwargs))
+    kwargs = _load_args(kwargs)
+    try:
+        return json.load(f, *args, **kwargs)
+    finally:
+        _release_blobs(kwargs['object_hook'])
 
 def loads(*args, **kwargs):
-    return json.loads(*args, **_load_args(kwargs))
+    kwargs = _load_args(kwargs)
+    try:
+        return json.loads(*args, **kwargs)
+    finally:
+        _release_blobs(kwargs['object_hook'])
+
+def iterload(f, **kwargs):
+    '''
+    Yield the elements of a top-level JSON array, or the values of a
+    top-level JSON object, one at a time, reading `f` incrementally so the
+    whole document is never held in memory. Accepts the same keyword
+    arguments as load, plus:
+
+    chunk_size: The number of bytes to read at a time.
+    '''
+    from baiji.serialization.util.openlib import ensure_file_open_and_iterate
+    if isinstance(f, basestring):
+        kwargs.setdefault('base_path', f)
+    return ensure_file_open_and_iterate(f, _iterload, 'r', **kwargs)
+
+def _iterload(f, chunk_size=ITERLOAD_CHUNK_SIZE, **kwargs):
+    kwargs = _load_args(kwargs)
+    raw_decode = json.JSONDecoder(**kwargs).raw_decode
+    reader = _IncrementalReader(f, chunk_size)
+    try:
+        opening = reader.peek()
+        if opening not in ('[', '{'):
+            raise ValueError('iterload expects a top-level JSON array or object')
+        closing = ']' if opening == '[' else '}'
+        reader.expect(opening)
+        if reader.peek() == closing:
+            reader.expect(closing)
+        else:
+            while True:
+                if opening == '{':
+                    if reader.peek() != '"':
+                        raise ValueError('Expecting property name at position {}'.format(reader.position))
+                    reader.decode(raw_decode)
+                    reader.expect(':')
+                yield reader.decode(raw_decode)
+                if reader.peek() == ',':
+                    reader.expect(',')
+                else:
+                    reader.expect(closing)
+                    break
+        if reader.peek() != '':
+            raise ValueError('Extra data at position {}'.format(reader.position))
+    finally:
+        _release_blobs(kwargs['object_hook'])
+
+class _IncrementalReader(object):
+    '''
+    Buffers a file a chunk at a time for iterload, discarding what's been
+    consumed whenever it reads more.
+    '''
+    def __init__(self, f, chunk_size):
+        import re
+        self.f = f
+        self.chunk_size = chunk_size
+        self.buf = ''
+        self.pos = 0
+        self.consumed = 0
+        self.eof = False
+        self.whitespace = re.compile(r'[ \t\n\r]*')
+        self.number_characters = re.compile(r'[0-9.eE+-]*')
+
+    @property
+    def position(self):
+        return self.consumed + self.pos
+
+    def read_more(self):
+        # Read at least as much as we're holding so that re-decoding a large
+        # value is amortized linear.
+        chunk = self.f.read(max(self.chunk_size, len(self.buf) - self.pos))
+        if not chunk:
+            self.eof = True
+            return False
+        self.consumed += self.pos
+        self.buf = self.buf[self.pos:] + chunk
+        self.pos = 0
+        return True
+
+    def peek(self):
+        '''
+        Skip whitespace and return the next character, or '' at the end of the file.
+        '''
+        while True:
+            self.pos = self.whitespace.match(self.buf, self.pos).end()
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+            if not self.read_more():
+                return ''
+
+    def expect(self, char):
+        if self.peek() != char:
+            raise ValueError('Expecting {!r} at position {}'.format(char, self.position))
+        self.pos += 1
+
+    def decode(self, raw_decode):
+        while True:
+            try:
+                value, end = raw_decode(self.buf, self.pos)
+            except ValueError:
+                # Probably a value that continues in the next chunk
+                if self.read_more():
+                    continue
+                raise
+            # A number which runs up to the end of the buffer, like `1.5` of
+            # `1.5e10`, may also continue in the next chunk
+            if not self.eof and self.number_characters.match(self.buf, end).end() == len(self.buf) and self.read_more():
+                continue
+            self.pos = end
+            return value
+
+def _path_module(path):
+    '''
+    Paths on s3 always use forward slashes, local paths use the
+    platform's separator.
+    '''
+    import os
+    import posixpath
+    return posixpath if '://' in path else os.path
+
+class BlobWriter(object):
+    '''
+    Appends array buffers to a binary file, keeping each one aligned to
+    BLOB_ALIGNMENT bytes, and returns the references that JSONDecoder uses to
+    read them back. The file is opened when the first array is written, and
+    closed when the writer's context exits.
+    '''
+    def __init__(self, path, threshold):
+        self.path = path
+        self.name = _path_module(path).basename(path)
+        self.threshold = threshold
+        self.offset = 0
+        self.context = None
+        self.f = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if self.context is not None:
+            self.context.__exit__(exc_type, exc_value, traceback)
+
+    def write(self, arr):
+        import numpy as np
+        if self.f is None:
+            from baiji.serialization.util.openlib import opened
+            self.context = opened(self.path, 'wb')
+            self.f = self.context.__enter__()
+        padding = -self.offset % BLOB_ALIGNMENT
+        if padding:
+            self.f.write('\0' * padding)
+            self.offset += padding
+        offset = self.offset
+        self.f.write(np.ascontiguousarray(arr).data)
+        self.offset += arr.nbytes
+        return {
+            '__ndarray_ref__': self.name,
+            'offset': offset,
+            'dtype': arr.dtype.name,
+            'byteorder': arr.dtype.str[0],
+            'shape': arr.shape,
+        }
 
 class MethodListCaller(object):
     '''
     This is an internal class that lets the JSON(En,De)coder classes
     and their subclasses easily register a list of methods to try, which
     will then be called in order until one of them succeeds.
+
+    Methods may be restricted to instances of particular types. The list of
+    methods which apply to a given type is worked out the first time an
+    instance of that type is seen, and cached.
+
+    Methods may also be restricted to dicts which contain particular keys.
+    When every method is restricted this way, a dict with none of those keys
+    goes straight to the default.
     '''
-    def register(self, method, index=-1):
+    def register(self, method, index=-1, types=None, keys=None):
+        '''
+        types: An optional tuple of types to which the method applies; it
+          will only be called for instances of those types and their
+          subclasses. May also be a callable which returns the tuple, so
+          that types from heavy modules needn't be imported until they're
+          needed.
+        keys: An optional sequence of keys; the method will only be called
+          for dicts which contain at least one of them.
+        '''
         if not hasattr(self, 'method_list'):
             self.clear()
         if index == -1:
             index = len(self.method_list)
         self.method_list.insert(index, method)
+        if types is not None:
+            self.method_types[method] = types
+        if keys is not None:
+            self.method_keys[method] = tuple(keys)
+        self.methods_by_type = {}
+        if all(m in self.method_keys for m in self.method_list):
+            self.marker_keys = tuple(set(k for m in self.method_list for k in self.method_keys[m]))
+        else:
+            self.marker_keys = None
 
     def clear(self):
         # be defensive if someone forgets to call super pylint: disable=attribute-defined-outside-init
         self.method_list = []
+        self.method_types = {}
+        self.method_keys = {}
+        self.methods_by_type = {}
+        self.marker_keys = None
+
+    def methods_for_type(self, cls):
+        '''
+        Return the registered methods, in order, which apply to instances of
+        cls, each paired with the keys it requires.
+        '''
+        result = []
+        for method in self.method_list:
+            types = self.method_types.get(method)
+            if types is not None and not isinstance(types, (type, tuple)):
+                types = types()
+            if types is None or issubclass(cls, types):
+                result.append((method, self.method_keys.get(method)))
+        return result
 
     def __call__(self, x):
         '''
         Call the methods in method_list until one of them returns something other than None
         and return that as the result of the call.
         '''
-        from itertools import ifilter
+        if self.marker_keys is not None:
+            for key in self.marker_keys:
+                if key in x:
+                    break
+            else:
+                return self.default(x)
+        cls = type(x)
         try:
-            return next(ifilter(lambda x: x is not None, (f(x) for f in self.method_list)))
-        except StopIteration:
-            return self.default(x)
+            methods = self.methods_by_type[cls]
+        except KeyError:
+            methods = self.methods_by_type[cls] = self.methods_for_type(cls)
+        for method, keys in methods:
+            if keys is not None and not any(key in x for key in keys):
+                continue
+            result = method(x)
+            if result is not None:
+                if instrumentation.enabled():
+                    instrumentation.count(method)
+                return result
+        return self.default(x)
 
     def default(self, x):
         '''
@@ -77,11 +409,30 @@ class JSONDecoder(MethodListCaller):
     Note that for object_hook, if we want to do nothing, we return the dict unchanged
     and the json is decoded as a plain old dict; this behavior is the default of
     MethodListCaller.
+
+    References to array data in an external blob file, written by
+    `dump(..., blob_threshold=...)`, are resolved against base_path, and are
+    memory mapped instead of read when mmap is True:
+
+        {
+            "__ndarray_ref__": "example.json.blob",
+            "offset": 0,
+            "dtype": "float32",
+            "byteorder": "<",
+            "shape": [3, 2]
+        }
     '''
+    base_path = None
+    mmap = False
+
     def __init__(self):
-        self.register(self.decode_numpy)
-        self.register(self.decode_scipy)
-        self.register(self.decode)
+        self.register(self.decode_numpy, keys=['__ndarray__'])
+        self.register(self.decode_ndarray_ref, keys=['__ndarray_ref__'])
+        self.register(self.decode_scipy, keys=['__scipy.sparse.sparsematrix__'])
+        # Only register decode when a subclass overrides it, so that dicts
+        # without any of the keys above can skip the decoders entirely.
+        if type(self).decode.__func__ is not JSONDecoder.decode.__func__:
+            self.register(self.decode)
 
     def decode(self, dct):
         '''
@@ -100,8 +451,54 @@ class JSONDecoder(MethodListCaller):
                 dtype = np.dtype(dct['dtype'])
             else:
                 dtype = np.float64
+            if dct.get('encoding') == 'base64':
+                import base64
+                dtype = dtype.newbyteorder(dct.get('byteorder', '='))
+                # Copy into a bytearray so the result is writable, like the
+                # arrays we build from lists.
+                data = bytearray(base64.b64decode(dct['__ndarray__']))
+                return np.frombuffer(data, dtype=dtype).reshape(dct['shape'])
             return np.array(dct['__ndarray__'], dtype=dtype)
 
+    def decode_ndarray_ref(self, dct):
+        if '__ndarray_ref__' in dct:
+            try:
+                import numpy as np
+            except ImportError:
+                raise ImportError("JSON file contains numpy arrays; install numpy to load it")
+            if not hasattr(self, 'blobs'):
+                self.blobs = {}
+            path = self.resolve_ref(dct['__ndarray_ref__'])
+            dtype = np.dtype(dct['dtype']).newbyteorder(dct['byteorder'])
+            count = int(np.prod(dct['shape']))
+            if self.mmap and count:
+                from baiji import path as s3path
+                from baiji.serialization.util import cache
+                local_path = path
+                if cache.applies_to(path, 'rb'):
+                    local_path = cache.current().fetch(path)
+                if s3path.islocal(local_path):
+                    return np.memmap(s3path.parse(local_path).path, dtype=dtype, mode='r', offset=dct['offset'], shape=tuple(dct['shape']))
+            if path not in self.blobs:
+                from baiji.serialization.util.openlib import ensure_file_open_and_call
+                # Read each blob once, into a bytearray so the arrays which
+                # view it are writable.
+                self.blobs[path] = ensure_file_open_and_call(path, lambda f: bytearray(f.read()), 'rb')
+            return np.frombuffer(self.blobs[path], dtype=dtype, count=count, offset=dct['offset']).reshape(dct['shape'])
+
+    def resolve_ref(self, ref):
+        '''
+        Return the path of a blob file, which must be a bare file name in
+        the directory of base_path. Anything else could read arbitrary
+        files, so it's rejected.
+        '''
+        if self.base_path is None:
+            raise ValueError("JSON contains a reference to {}; pass base_path to load it".format(ref))
+        if not isinstance(ref, basestring) or not ref or ref in ('.', '..') or any(c in ref for c in '/\\:\0'):
+            raise ValueError("Invalid array reference {!r}; only the names of files next to the JSON file are allowed".format(ref))
+        path_module = _path_module(self.base_path)
+        return path_module.join(path_module.dirname(self.base_path), ref)
+
     def decode_scipy(self, dct):
         if '__scipy.sparse.sparsematrix__' in dct:
             if not 'dtype' in dct and 'shape' in dct and 'data' in dct and 'format' in dct and 'row' in dct and 'col' in dct:
@@ -111,7 +508,15 @@ class JSONDecoder(MethodListCaller):
                 import scipy.sparse as sp
             except ImportError:
                 raise ImportError("JSON file contains scipy.sparse arrays; install numpy and scipy to load it")
-            coo = sp.coo_matrix((dct['data'], (dct['row'], dct['col'])), shape=dct['shape'], dtype=np.dtype(dct['dtype']))
+            dtype = np.dtype(dct['dtype'])
+            shape = tuple(dct['shape'])
+            if 'indptr' in dct:
+                cls = {'csr': sp.csr_matrix, 'csc': sp.csc_matrix, 'bsr': sp.bsr_matrix}[dct['format']]
+                return cls((dct['data'], dct['indices'], dct['indptr']), shape=shape, dtype=dtype)
+            if 'offsets' in dct:
+                return sp.dia_matrix((dct['data'], dct['offsets']), shape=shape, dtype=dtype)
+            # COO, which every format was stored as before
+            coo = sp.coo_matrix((dct['data'], (dct['row'], dct['col'])), shape=shape, dtype=dtype)
             return coo.asformat(dct['format'])
 
 
@@ -123,9 +528,23 @@ def _load_args(kwargs):
         del kwargs['decoder']
     else:
         kwargs['object_hook'] = JSONDecoder()
+    base_path = kwargs.pop('base_path', None)
+    if hasattr(kwargs['object_hook'], 'base_path'):
+        kwargs['object_hook'].base_path = base_path
+    mmap = kwargs.pop('mmap', False)
+    if hasattr(kwargs['object_hook'], 'mmap'):
+        kwargs['object_hook'].mmap = mmap
+    elif mmap:
+        raise ValueError("mmap requires a JSONDecoder")
     return kwargs
 
 
+def _release_blobs(decoder):
+    # Decoders may be reused across loads, and blob files may change between them
+    if getattr(decoder, 'blobs', None):
+        decoder.blobs = {}
+
+
 class JSONEncoder(MethodListCaller):
     '''
     Instances may be passed to simplejson as default to encode json objects.
@@ -146,11 +565,25 @@ class JSONEncoder(MethodListCaller):
     Note that for default, if we want to do nothing, we return None and the object
     is encoded as best as simplejson can (which is often by throwing a TypeError).
     We override MethodListCaller.default to get this behavior.
+
+    When binary is True, numeric arrays are instead written as their raw bytes,
+    base64 encoded, which is much smaller and faster to read and write:
+
+        {
+            "__ndarray__": "AMBWRADAVkQAAFlDAADUQgAAl0MAAAxD",
+            "encoding": "base64",
+            "dtype": "float32",
+            "byteorder": "<",
+            "shape": [3, 2]
+        }
     '''
-    def __init__(self, primitive=ENCODE_PRIMITIVES_BY_DEFAULT):
+    blob = None
+
+    def __init__(self, primitive=ENCODE_PRIMITIVES_BY_DEFAULT, binary=ENCODE_BINARY_BY_DEFAULT):
         self.primitive = primitive
-        self.register(self.encode_numpy)
-        self.register(self.encode_scipy)
+        self.binary = binary
+        self.register(self.encode_numpy, types=_numpy_types)
+        self.register(self.encode_scipy, types=_scipy_types)
         self.register(self.encode)
 
     def default(self, x):
@@ -169,18 +602,29 @@ class JSONEncoder(MethodListCaller):
             if isinstance(obj, np.ndarray):
                 if self.primitive:
                     return obj.tolist()
+                elif self.blob is not None and obj.nbytes >= self.blob.threshold and obj.dtype.kind in 'biufc':
+                    return self.blob.write(obj)
+                elif self.binary and obj.dtype.kind in 'biufc':
+                    import base64
+                    return {
+                        '__ndarray__': base64.b64encode(np.ascontiguousarray(obj).tobytes()),
+                        'encoding': 'base64',
+                        'dtype': obj.dtype.name,
+                        'byteorder': obj.dtype.str[0],
+                        'shape': obj.shape,
+                    }
                 else:
                     return {
                         '__ndarray__': obj.tolist(),
                         'dtype': obj.dtype.name,
                         'shape': obj.shape,
                     }
-            elif isinstance(obj, (np.bool8, np.bool_)):
-                return bool(obj)
-            elif isinstance(obj, (np.half, np.single, np.double, np.float_, np.longfloat, np.float16, np.float32, np.float64)) or (hasattr(np, 'float128') and isinstance(obj, np.float128)):
+            elif isinstance(obj, np.floating):
                 return float(obj)
-            elif isinstance(obj, (np.byte, np.short, np.intc, np.int_, np.longlong, np.intp, np.int8, np.int16, np.int32, np.int64, np.ubyte, np.ushort, np.uintc, np.uint, np.ulonglong, np.uintp, np.uint8, np.uint16, np.uint32, np.uint64)):
+            elif isinstance(obj, np.integer):
                 return int(obj)
+            elif isinstance(obj, np.bool_):
+                return bool(obj)
             else:
                 return None
         except ImportError:
@@ -191,16 +635,22 @@ class JSONEncoder(MethodListCaller):
         try:
             import scipy.sparse as sp
             if sp.isspmatrix(obj):
-                coo = obj.tocoo()
-                return {
+                result = {
                     '__scipy.sparse.sparsematrix__': True,
                     'format': obj.getformat(),
                     'dtype': obj.dtype.name,
                     'shape': obj.shape,
-                    'data': coo.data,
-                    'row': coo.row,
-                    'col': coo.col,
                 }
+                # Store the arrays of formats which can be rebuilt from them
+                # directly, and convert the others to COO
+                if obj.getformat() in SPARSE_COMPRESSED_FORMATS:
+                    result.update(data=obj.data, indices=obj.indices, indptr=obj.indptr)
+                elif obj.getformat() == 'dia':
+                    result.update(data=obj.data, offsets=obj.offsets)
+                else:
+                    coo = obj.tocoo(copy=False)
+                    result.update(data=coo.data, row=coo.row, col=coo.col)
+                return result
             else:
                 return None
         except ImportError:
@@ -208,6 +658,23 @@ class JSONEncoder(MethodListCaller):
             return None
 
 
+def _numpy_types():
+    # If numpy hasn't been imported, there can't be any numpy objects to encode
+    import sys
+    if 'numpy' not in sys.modules:
+        return ()
+    import numpy as np
+    return (np.ndarray, np.generic)
+
+
+def _scipy_types():
+    import sys
+    if 'scipy.sparse' not in sys.modules:
+        return ()
+    import scipy.sparse as sp
+    return (sp.spmatrix,)
+
+
 def _dump_args(kwargs):
     if 'default' in kwargs:
         raise ValueError("Instead of explicitly setting default, subclass JSONEncoder and pass it as encoder")
@@ -215,8 +682,14 @@ def _dump_args(kwargs):
         kwargs['default'] = kwargs['encoder']
         del kwargs['encoder']
     else:
-        kwargs['default'] = JSONEncoder(primitive=kwargs.get('primitive', ENCODE_PRIMITIVES_BY_DEFAULT))
+        kwargs['default'] = JSONEncoder(
+            primitive=kwargs.get('primitive', ENCODE_PRIMITIVES_BY_DEFAULT),
+            binary=kwargs.get('binary', ENCODE_BINARY_BY_DEFAULT))
     if 'primitive' in kwargs:
         del kwargs['primitive']
+    if 'binary' in kwargs:
+        del kwargs['binary']
+    if 'blob' in kwargs:
+        kwargs['default'].blob = kwargs.pop('blob')
     kwargs['for_json'] = True
     return kwargs
@@ -0,0 +1,134 @@
+from __future__ import absolute_import
+
+# JSON Lines: one JSON document per line. Records are encoded and decoded
+# with baiji.serialization.json, so numpy arrays and scipy.sparse matrices
+# round-trip.
+
+__all__ = ['load', 'aload', 'adump', 'loads', 'iterload', 'dump', 'dumps', 'EXTENSION']
+
+EXTENSION = '.jsonl'
+CHUNK_SIZE = 4 * 1024 * 1024
+
+
+def dump(obj, f, **kwargs):
+    '''
+    obj: An iterable of records, which is consumed as it's written.
+
+    Accepts the same keyword arguments as json.dump, except indent.
+    '''
+    from baiji.serialization.util.openlib import ensure_file_open_and_call
+    return ensure_file_open_and_call(f, _dump, 'w', obj, **kwargs)
+
+
+def dumps(obj, **kwargs):
+    import StringIO
+    output = StringIO.StringIO()
+    _dump(output, obj, **kwargs)
+    out_string = output.getvalue()
+    output.close()
+    return out_string
+
+
+def _dump(f, obj, **kwargs):
+    import simplejson
+    from baiji.serialization import json
+    if kwargs.get('indent') is not None:
+        raise ValueError('JSON Lines records must each fit on one line; indent is not supported')
+    encoder = simplejson.JSONEncoder(**json._dump_args(kwargs)) # pylint: disable=protected-access
+    for record in obj:
+        f.write(encoder.encode(record))
+        f.write('\n')
+
+
+def adump(obj, f, *args, **kwargs):
+    '''
+    Like dump, but run in the background and return a Future. See
+    baiji.serialization.util.asynclib.
+    '''
+    from baiji.serialization.util.asynclib import submit
+    return submit(dump, obj, f, *args, **kwargs)
+
+
+def load(f, **kwargs):
+    '''
+    Return a list of the records in f. Accepts the same arguments as iterload.
+    '''
+    return list(iterload(f, **kwargs))
+
+
+def aload(f, *args, **kwargs):
+    '''
+    Like load, but run in the background and return a Future. See
+    baiji.serialization.util.asynclib.
+    '''
+    from baiji.serialization.util.asynclib import submit
+    return submit(load, f, *args, **kwargs)
+
+
+def loads(s, **kwargs):
+    return _decode_block(s, kwargs)
+
+
+def iterload(f, processes=None, chunk_size=CHUNK_SIZE, **kwargs):
+    '''
+    Yield the records in f, in order.
+
+    processes: When greater than one, f is read in blocks of about
+      chunk_size bytes, which are decoded in parallel by a pool of this many
+      processes. Keyword arguments are sent to the workers, so pass a
+      JSONDecoder subclass as decoder, rather than an instance.
+    chunk_size: The approximate number of bytes in each block.
+
+    The remaining keyword arguments are the same as json.load.
+    '''
+    from baiji.serialization.util.openlib import ensure_file_open_and_iterate
+    return ensure_file_open_and_iterate(f, _iterload, 'r', processes=processes, chunk_size=chunk_size, **kwargs)
+
+
+def _iterload(f, processes=None, chunk_size=CHUNK_SIZE, **kwargs):
+    if not processes or processes == 1:
+        for block in _read_blocks(f, chunk_size):
+            for record in _decode_block(block, kwargs):
+                yield record
+        return
+
+    from collections import deque
+    from multiprocessing import Pool
+    pool = Pool(processes)
+    try:
+        # Keep a bounded number of blocks in flight, so a huge file is never
+        # read far ahead of what's been decoded.
+        pending = deque()
+        for block in _read_blocks(f, chunk_size):
+            pending.append(pool.apply_async(_decode_block, (block, kwargs)))
+            if len(pending) >= 2 * processes:
+                for record in pending.popleft().get():
+                    yield record
+        while pending:
+            for record in pending.popleft().get():
+                yield record
+        pool.close()
+    finally:
+        pool.terminate()
+        pool.join()
+
+
+def _read_blocks(f, chunk_size):
+    '''
+    Yield strings of whole lines, of about chunk_size bytes each.
+    '''
+    while True:
+        lines = f.readlines(chunk_size)
+        if not lines:
+            return
+        yield ''.join(lines)
+
+
+def _decode_block(block, kwargs):
+    import simplejson
+    from baiji.serialization import json
+    kwargs = dict(kwargs)
+    if isinstance(kwargs.get('decoder'), type):
+        kwargs['decoder'] = kwargs['decoder']()
+    decoder = simplejson.JSONDecoder(**json._load_args(kwargs)) # pylint: disable=protected-access
+    return [decoder.decode(line) for line in block.split('\n') if line.strip()]
@@ -2,27 +2,108 @@ from cPickle import UnpicklingError # We import this to expose it to our importe
 
 EXTENSION = '.pkl'
 
-def dump(obj, f):
+# With out_of_band, large arrays are written after the pickle instead of
+# inside it:
+#
+#     MAGIC, the pickle's length as a little-endian uint64, the pickle,
+#     then the raw bytes of each array, each starting at a multiple of
+#     OUT_OF_BAND_ALIGNMENT from the start of the file.
+#
+# The pickle refers to the arrays by persistent id. Files without MAGIC
+# are loaded as plain pickles.
+MAGIC = '\x93BAIJIPK'
+OUT_OF_BAND_ALIGNMENT = 64
+OUT_OF_BAND_THRESHOLD = 64 * 1024
+
+def dump(obj, f, compression=None, out_of_band=False):
+    '''
+    out_of_band: Write numeric ndarrays of at least OUT_OF_BAND_THRESHOLD
+      bytes straight to the file after the pickle, instead of copying them
+      into it. This keeps the peak memory of dumping them near the size of
+      the arrays themselves, and lets load read them in place.
+    '''
     from baiji.serialization.util.openlib import ensure_file_open_and_call
-    return ensure_file_open_and_call(f, _dump, 'wb', obj)
+    return ensure_file_open_and_call(f, _dump, 'wb', obj, compression=compression, out_of_band=out_of_band)
+
+def adump(obj, f, *args, **kwargs):
+    '''
+    Like dump, but run in the background and return a Future. See
+    baiji.serialization.util.asynclib.
+    '''
+    from baiji.serialization.util.asynclib import submit
+    return submit(dump, obj, f, *args, **kwargs)
 
 def load(f, *args, **kwargs):
     from baiji.serialization.util.openlib import ensure_file_open_and_call
     return ensure_file_open_and_call(f, _load, 'rb', *args, **kwargs)
 
+def aload(f, *args, **kwargs):
+    '''
+    Like load, but run in the background and return a Future. See
+    baiji.serialization.util.asynclib.
+    '''
+    from baiji.serialization.util.asynclib import submit
+    return submit(load, f, *args, **kwargs)
+
 def loads(s, *args, **kwargs):
     import cPickle as pickle
+    if s.startswith(MAGIC):
+        from cStringIO import StringIO
+        return _load(StringIO(s), *args, **kwargs)
     return pickle.loads(s, *args, **kwargs)
 
 def dumps(obj):
     import cPickle as pickle
     return pickle.dumps(obj, pickle.HIGHEST_PROTOCOL)
 
-def _dump(f, obj):
+def _dump(f, obj, out_of_band=False):
     import cPickle as pickle
-    return pickle.dump(obj, f, pickle.HIGHEST_PROTOCOL)
+    if not out_of_band:
+        return pickle.dump(obj, f, pickle.HIGHEST_PROTOCOL)
+    import struct
+    from cStringIO import StringIO
+    arrays = []
+    pickled = StringIO()
+    pickler = pickle.Pickler(pickled, pickle.HIGHEST_PROTOCOL)
+    pickler.persistent_id = _out_of_band_persistent_id(arrays)
+    pickler.dump(obj)
+    pickled = pickled.getvalue()
+    f.write(MAGIC)
+    f.write(struct.pack('<Q', len(pickled)))
+    f.write(pickled)
+    position = len(MAGIC) + 8 + len(pickled)
+    for arr in arrays:
+        padding = -position % OUT_OF_BAND_ALIGNMENT
+        f.write('\0' * padding)
+        f.write(buffer(arr)) # Without a copy, since it's contiguous
+        position += padding + arr.nbytes
+
+def _out_of_band_persistent_id(arrays):
+    '''
+    Return a persistent_id which appends large numeric arrays to arrays,
+    contiguous in the order they'll be stored, and refers to them by index.
+    '''
+    import sys
+    np = sys.modules.get('numpy')
+    if np is None:
+        # If numpy hasn't been imported, there can't be any arrays
+        return lambda obj: None
+    ids = {}
+
+    def persistent_id(obj):
+        if type(obj) is not np.ndarray or obj.nbytes < OUT_OF_BAND_THRESHOLD or obj.dtype.kind not in 'biufc':
+            return None
+        # cPickle asks before checking its memo, so handle repeats here. obj
+        # is kept, so its id can't be reused by another object.
+        if id(obj) not in ids:
+            order = 'F' if obj.flags.f_contiguous and not obj.flags.c_contiguous else 'C'
+            ids[id(obj)] = (('ndarray', len(arrays), obj.dtype.str, obj.shape, order), obj)
+            arrays.append(np.asarray(obj, order=order))
+        return ids[id(obj)][0]
 
-def _load(f, constructors=None):
+    return persistent_id
+
+def _load(f, constructors=None, module_renames=None, mmap=False):
     '''
     constructors: A dictionary mapping strings to callables, which are
       consulted as additional constructors during unpickling. This is useful
@@ -31,21 +112,206 @@ def _load(f, constructors=None):
       `Unpickler`'s `find_global` attribute, which is documented here,
       albeit quite densely:
       https://docs.python.org/2/library/pickle.html#subclassing-unpicklers
+    module_renames: A dictionary mapping old module names to new ones, for
+      supporting modules or whole packages which have been moved. A name
+      also renames the modules inside it, and the longest match wins, so
+      {'old': 'new'} loads old.sub.Class as new.sub.Class. constructors are
+      consulted with both the old and the new name.
+    mmap: When f is a local, uncompressed file written with out_of_band,
+      return its out-of-band arrays as read-only np.memmap views instead of
+      reading them into memory.
     '''
     import cPickle as pickle
+
+    find_global = _find_global(constructors, module_renames) if constructors or module_renames else None
+
+    # Offsets in the stream are relative to where the pickle starts, which
+    # memory mapping needs to know
+    start = 0
+    if mmap:
+        try:
+            start = f.tell()
+        except (AttributeError, IOError):
+            mmap = False
+
+    prefix = f.read(len(MAGIC))
+    if prefix != MAGIC:
+        unpickler = pickle.Unpickler(_unread(f, prefix))
+        if find_global:
+            unpickler.find_global = find_global
+        return unpickler.load()
+
+    import struct
+    from cStringIO import StringIO
+    length, = struct.unpack('<Q', f.read(8))
+    unpickler = pickle.Unpickler(StringIO(f.read(length)))
+    if find_global:
+        unpickler.find_global = find_global
+    reader = _OutOfBandReader(f, len(MAGIC) + 8 + length, mmap, start)
+    unpickler.persistent_load = reader.persistent_load
+    result = unpickler.load()
+    reader.read_pending()
+    return result
+
+# Globals which find_global has resolved, by (module name, name), to
+# (module, global)
+_resolved_globals = {}
+
+def _find_global(constructors, module_renames):
+    '''
+    Return a find_global for an Unpickler, which looks names up in
+    constructors and applies module_renames, as _load describes.
+    '''
+    import sys
     from baiji.serialization.util.importlib import class_from_str
+    # Rebuilt for each load, so changes to constructors are always seen
+    by_key = {}
+    for fully_qualified_name, constructor in (constructors or {}).iteritems():
+        module_name, _, name = fully_qualified_name.rpartition('.')
+        by_key[(module_name, name)] = constructor
+    # Longest first, so the most specific rename wins
+    renames = sorted((module_renames or {}).iteritems(), key=lambda item: -len(item[0]))
+    renamed_modules = {}
 
-    def unpickler_find_global(module_name, class_name):
-        fully_qualified_name = '{}.{}'.format(module_name, class_name)
+    def rename(module_name):
+        if module_name not in renamed_modules:
+            renamed = module_name
+            for old, new in renames:
+                if module_name == old or module_name.startswith(old + '.'):
+                    renamed = new + module_name[len(old):]
+                    break
+            renamed_modules[module_name] = renamed
+        return renamed_modules[module_name]
+
+    def find_global(module_name, name):
+        try:
+            return by_key[(module_name, name)]
+        except KeyError:
+            pass
+        module_name = rename(module_name)
+        key = (module_name, name)
         try:
-            return constructors[fully_qualified_name]
+            return by_key[key]
         except KeyError:
+            pass
+        module = sys.modules.get(module_name)
+        cached = _resolved_globals.get(key)
+        # Only trust the cache while the module is the one it was resolved
+        # from and still has the same attribute, so reloaded or patched
+        # modules are seen
+        if module is not None and cached is not None and cached[0] is module and getattr(module, name, None) is cached[1]:
+            return cached[1]
+        try:
+            if module is None:
+                __import__(module_name)
+                module = sys.modules[module_name]
+            result = getattr(module, name)
+        except Exception: # pylint: disable=broad-except
             # It would be tempting to delegate to the original `find_global`.
             # Unfortunately, `Unpickler` does not expose the default
-            # implementation. Thanks, Obama.
-            return class_from_str(fully_qualified_name)
+            # implementation. Thanks, Obama. class_from_str gives a more
+            # helpful error.
+            result = class_from_str('{}.{}'.format(module_name, name))
+        _resolved_globals[key] = (sys.modules.get(module_name), result)
+        return result
+
+    return find_global
+
+def _unread(f, prefix):
+    '''
+    Return a file which reads prefix, which was read from f, and then the
+    rest of f.
+    '''
+    if prefix:
+        try:
+            f.seek(-len(prefix), 1)
+            return f
+        except (AttributeError, IOError):
+            pass
+    from StringIO import StringIO
+    return _Concatenated(StringIO(prefix), f)
+
+class _Concatenated(object):
+    def __init__(self, first, second):
+        self.first = first
+        self.second = second
+
+    def read(self, size=-1):
+        result = self.first.read(size)
+        if size is None or size < 0:
+            return result + self.second.read()
+        if len(result) < size:
+            result += self.second.read(size - len(result))
+        return result
+
+    def readline(self):
+        result = self.first.readline()
+        if not result.endswith('\n'):
+            result += self.second.readline()
+        return result
+
+class _OutOfBandReader(object):
+    '''
+    Resolves the persistent ids written by _out_of_band_persistent_id.
+    Each array is preallocated when the pickle refers to it, and filled by
+    read_pending once the pickle is loaded, or is memory mapped.
+    '''
+    def __init__(self, f, position, mmap, file_offset=0):
+        '''
+        file_offset: Where the stream starts in the file, when it's memory
+          mapped.
+        '''
+        self.f = f
+        self.start = self.position = position
+        self.file_offset = file_offset
+        self.path = None
+        if mmap:
+            import os
+            name = getattr(f, 'name', None)
+            if isinstance(name, basestring) and os.path.isfile(name):
+                self.path = name
+        self.arrays = []
+        self.pending = []
+
+    def persistent_load(self, pid):
+        import numpy as np
+        kind, index, dtype, shape, order = pid
+        if kind != 'ndarray':
+            raise UnpicklingError('Unknown persistent id {}'.format(pid))
+        if index < len(self.arrays):
+            return self.arrays[index]
+        dtype = np.dtype(dtype)
+        nbytes = dtype.itemsize * int(np.prod(shape))
+        # Arrays are stored in the order they're first referred to
+        offset = self.position + (-self.position % OUT_OF_BAND_ALIGNMENT)
+        if self.path is not None and nbytes:
+            arr = np.memmap(self.path, dtype=dtype, mode='r', offset=self.file_offset + offset, shape=tuple(shape), order=order)
+        else:
+            raw = np.empty(nbytes, dtype=np.uint8)
+            self.pending.append((offset, raw))
+            arr = raw.view(dtype).reshape(shape, order=order)
+        self.arrays.append(arr)
+        self.position = offset + nbytes
+        return arr
+
+    def read_pending(self):
+        position = self.start
+        for offset, raw in self.pending:
+            self.f.read(offset - position) # Padding, and any memory mapped arrays
+            _readinto(self.f, raw)
+            position = offset + raw.nbytes
 
-    unpickler = pickle.Unpickler(f)
-    if constructors:
-        unpickler.find_global = unpickler_find_global
-    return unpickler.load()
+def _readinto(f, raw):
+    view = memoryview(raw)
+    if hasattr(f, 'readinto'):
+        filled = 0
+        while filled < len(raw):
+            count = f.readinto(view[filled:])
+            if not count:
+                raise UnpicklingError('Out-of-band array data is truncated')
+            filled += count
+    else:
+        data = f.read(len(raw))
+        if len(data) < len(raw):
+            raise UnpicklingError('Out-of-band array data is truncated')
+        view[:] = data
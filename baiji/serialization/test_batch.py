@@ -0,0 +1,56 @@
+import unittest
+import os
+from baiji.serialization import load_many, dump_many
+
+class TestBatch(unittest.TestCase):
+
+    def setUp(self):
+        import tempfile
+        self.tmp_dir = tempfile.mkdtemp('baiji-serialization-batch')
+
+    def tearDown(self):
+        import shutil
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+
+    def paths(self, *names):
+        return [os.path.join(self.tmp_dir, name) for name in names]
+
+    def test_dump_many_and_load_many_by_extension(self):
+        paths = self.paths('a.json', 'b.yaml', 'c.pkl', 'd.json.gz', 'e.jsonl')
+        objs = [{'a': 1}, {'b': 2}, {'c': 3}, {'d': 4}, [{'e': 5}]]
+        dump_many(dict(zip(paths, objs)))
+        self.assertEqual(load_many(paths), objs)
+
+    def test_load_many_unordered(self):
+        paths = self.paths(*['{}.json'.format(i) for i in range(20)])
+        dump_many({path: i for i, path in enumerate(paths)})
+        results = dict(load_many(paths, ordered=False, threads=4))
+        self.assertEqual(results, {path: i for i, path in enumerate(paths)})
+
+    def test_load_many_with_format(self):
+        path, = self.paths('data.txt')
+        dump_many({path: [1, 2]}, format='json')
+        self.assertEqual(load_many([path], format='json'), [[1, 2]])
+
+    def test_load_many_in_processes(self):
+        paths = self.paths('a.json', 'b.csv.bz2')
+        dump_many({paths[0]: {'a': 1}, paths[1]: [['x'], ['y']]})
+        self.assertEqual(load_many(paths, processes=2), [{'a': 1}, [{'x': 'y'}]])
+
+    def test_load_many_errors(self):
+        paths = self.paths('a.json', 'missing.json', 'unknown.ext')
+        dump_many({paths[0]: 'a'})
+        with self.assertRaises(Exception):
+            load_many(paths)
+        results = load_many(paths, errors='return')
+        self.assertEqual(results[0], 'a')
+        self.assertIsInstance(results[1], Exception)
+        self.assertIsInstance(results[2], ValueError)
+
+    def test_dump_many_errors(self):
+        good, bad = self.paths('a.json', 'a.ext')
+        failures = dump_many({good: 'a', bad: 'b'}, errors='return')
+        self.assertEqual(failures.keys(), [bad])
+        self.assertEqual(load_many([good]), ['a'])
+        with self.assertRaises(ValueError):
+            dump_many({bad: 'b'})
@@ -0,0 +1,143 @@
+import unittest
+import os
+from baiji.serialization import bjson
+
+class TestBjson(unittest.TestCase):
+
+    def setUp(self):
+        import tempfile
+        self.tmp_dir = tempfile.mkdtemp('baiji-serialization-bjson')
+
+    def tearDown(self):
+        import shutil
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+
+    def test_bjson_round_trip_builtins(self):
+        obj = {
+            'none': None, 'bools': [True, False], 'int': -3, 'long': 2 ** 70,
+            'float': 1.5, 'str': 'foo\0bar', 'unicode': u'\u1234', 'tuple': (1, 2),
+            1: 'int key', 'nested': {'list': [[], {}]},
+        }
+        res = bjson.loads(bjson.dumps(obj))
+        expected = dict(obj, tuple=[1, 2])
+        self.assertEqual(res, expected)
+        self.assertIsInstance(res['unicode'], unicode)
+        self.assertIsInstance(res['str'], str)
+
+    def test_bjson_round_trip_arrays(self):
+        import numpy as np
+        obj = {
+            'float': np.random.rand(3, 4),
+            'fortran': np.asfortranarray(np.arange(12.).reshape(3, 4)),
+            'strided': np.arange(10)[::2],
+            'big_endian': np.arange(5, dtype='>i4'),
+            'empty': np.zeros((0, 3), dtype=np.uint8),
+            'bools': np.array([True, False]),
+            'complex': np.array([1j, 2]),
+            'scalars': [np.float32(1.5), np.int64(2), np.bool_(True)],
+        }
+        res = bjson.loads(bjson.dumps(obj))
+        for k in obj:
+            np.testing.assert_array_equal(res[k], obj[k])
+        for k in ['float', 'fortran', 'big_endian', 'empty', 'bools', 'complex']:
+            self.assertEqual(res[k].dtype, obj[k].dtype)
+            self.assertEqual(res[k].shape, obj[k].shape)
+        self.assertTrue(res['fortran'].flags.f_contiguous)
+        self.assertEqual(res['scalars'], [1.5, 2, True])
+
+    def test_bjson_arrays_are_aligned_views(self):
+        import numpy as np
+        path = os.path.join(self.tmp_dir, 'test.bjson')
+        bjson.dump({'a': np.arange(100.), 'b': 'x', 'c': np.arange(7, dtype=np.int8)}, path)
+        res = bjson.load(path)
+
+        def buffer_of(arr):
+            while isinstance(arr, np.ndarray):
+                self.assertEqual(arr.ctypes.data % 16, 0)
+                arr = arr.base
+            return arr
+
+        self.assertIsInstance(buffer_of(res['a']), bytearray)
+        self.assertIs(buffer_of(res['c']), buffer_of(res['a']))
+        self.assertTrue(res['a'].flags.writeable)
+
+    def test_bjson_load_without_readinto(self):
+        import mmap
+        import numpy as np
+        path = os.path.join(self.tmp_dir, 'test.bjson')
+        obj = {'a': np.arange(100.), 'b': 'x'}
+        with open(path, 'wb') as f:
+            f.write('12345678')
+            bjson.dump(obj, f)
+
+        class NoReadinto(object):
+            def __init__(self, f):
+                self.f = f
+            def __getattr__(self, name):
+                if name == 'readinto':
+                    raise AttributeError(name)
+                return getattr(self.f, name)
+
+        for wrap, buffer_type in [(lambda f: f, bytearray), (NoReadinto, mmap.mmap)]:
+            with open(path, 'rb') as f:
+                f.read(8)
+                res = bjson.load(wrap(f))
+            arr = res['a']
+            while isinstance(arr, np.ndarray):
+                arr = arr.base
+            self.assertIsInstance(arr, buffer_type)
+            np.testing.assert_array_equal(res['a'], obj['a'])
+            self.assertEqual(res['b'], 'x')
+            self.assertTrue(res['a'].flags.writeable)
+
+    def test_bjson_round_trip_sparse(self):
+        import numpy as np
+        import scipy.sparse as sp
+        for matrix in [sp.csr_matrix(np.eye(3)), sp.coo_matrix(np.arange(6.).reshape(2, 3))]:
+            res = bjson.loads(bjson.dumps([matrix]))[0]
+            self.assertEqual(res.getformat(), matrix.getformat())
+            np.testing.assert_array_equal(res.todense(), matrix.todense())
+
+    def test_bjson_rejects_blob_references(self):
+        secret = os.path.join(self.tmp_dir, 'secret.txt')
+        with open(secret, 'w') as f:
+            f.write('x' * 16)
+        for ref in [secret, 's3://bucket/secret.txt', 'secret.txt']:
+            dumped = bjson.dumps({'x': {'__ndarray_ref__': ref, 'offset': 0, 'dtype': 'uint8', 'byteorder': '|', 'shape': [16]}})
+            self.assertRaises(ValueError, bjson.loads, dumped)
+
+    def test_bjson_uses_encoder_and_decoder_subclasses(self):
+        from baiji.serialization.json import JSONEncoder, JSONDecoder
+        import numpy as np
+
+        class Point(object):
+            def __init__(self, x):
+                self.x = x
+
+        class PointEncoder(JSONEncoder):
+            def encode(self, obj):
+                if isinstance(obj, Point):
+                    return {'__point__': obj.x}
+
+        class PointDecoder(JSONDecoder):
+            def decode(self, dct):
+                if '__point__' in dct:
+                    return Point(dct['__point__'])
+                return dct
+
+        res = bjson.loads(bjson.dumps([Point(np.arange(3))], encoder=PointEncoder()), decoder=PointDecoder())
+        np.testing.assert_array_equal(res[0].x, np.arange(3))
+
+    def test_bjson_rejects_bad_input(self):
+        import numpy as np
+        data = bjson.dumps({'a': np.arange(10)})
+        self.assertRaises(ValueError, bjson.loads, 'not bjson')
+        self.assertRaises(ValueError, bjson.loads, data[:-3])
+        self.assertRaises(ValueError, bjson.loads, data + 'N')
+        self.assertRaises(TypeError, bjson.dumps, {(1, 2): 3})
+
+    def test_bjson_is_found_by_extension(self):
+        import baiji.serialization
+        path = os.path.join(self.tmp_dir, 'test.bjson.gz')
+        baiji.serialization.dump({'a': [1, 2]}, path)
+        self.assertEqual(baiji.serialization.load(path), {'a': [1, 2]})
@@ -2,6 +2,71 @@ import unittest
 
 class TestCSV(unittest.TestCase):
 
+    def test_load_with_header_row(self):
+        from StringIO import StringIO
+        from baiji.serialization import csv
+
+        self.assertEqual(
+            csv.load(StringIO('foo,bar\n1,2\n3,4\n')),
+            [{'foo': '1', 'bar': '2'}, {'foo': '3', 'bar': '4'}])
+        self.assertEqual(
+            csv.load(StringIO('foo,bar\n1,2\n'), header_row_transformer=lambda names: [x.upper() for x in names]),
+            [{'FOO': '1', 'BAR': '2'}])
+
+    def test_load_without_header_row(self):
+        from StringIO import StringIO
+        from baiji.serialization import csv
+
+        self.assertEqual(
+            csv.load(StringIO('foo,bar\n1,2\n'), header_row=False),
+            [{0: 'foo', 1: 'bar'}, {0: '1', 1: '2'}])
+
+    def test_load_columnar(self):
+        import numpy as np
+        from StringIO import StringIO
+        from baiji.serialization import csv
+
+        res = csv.load(StringIO('name,x,n\na,1.5,1\nb,2.5,2\n'), columnar=True, dtypes={'x': np.float32, 'n': np.int64})
+        self.assertEqual(sorted(res.keys()), ['n', 'name', 'x'])
+        np.testing.assert_array_equal(res['name'], np.array(['a', 'b']))
+        np.testing.assert_array_equal(res['x'], np.array([1.5, 2.5]))
+        self.assertEqual(res['x'].dtype, np.float32)
+        np.testing.assert_array_equal(res['n'], np.array([1, 2]))
+        self.assertEqual(res['n'].dtype, np.int64)
+
+        res = csv.load(StringIO('1,2\n3,4\n'), header_row=False, columnar=True, dtypes={1: int})
+        np.testing.assert_array_equal(res[0], np.array(['1', '3']))
+        np.testing.assert_array_equal(res[1], np.array([2, 4]))
+
+        self.assertRaises(ValueError, csv.load, StringIO('1,2\n3\n'), header_row=False, columnar=True)
+        self.assertEqual(csv.load(StringIO(''), header_row=False, columnar=True), {})
+        self.assertEqual(csv.load(StringIO('foo\n'), columnar=True)['foo'].shape, (0,))
+
+    def test_load_columnar_in_batches(self):
+        import numpy as np
+        from StringIO import StringIO
+        from baiji.serialization import csv
+
+        text = 'name,n\n' + ''.join('{},{}\n'.format('x' * (i % 7), i) for i in range(25))
+        original_batch_size = csv.COLUMNAR_BATCH_SIZE
+        csv.COLUMNAR_BATCH_SIZE = 4
+        try:
+            res = csv.load(StringIO(text), columnar=True, dtypes={'n': np.int64})
+        finally:
+            csv.COLUMNAR_BATCH_SIZE = original_batch_size
+        np.testing.assert_array_equal(res['n'], np.arange(25))
+        self.assertEqual(res['name'].tolist(), ['x' * (i % 7) for i in range(25)])
+
+    def test_iterload_yields_rows_lazily(self):
+        from StringIO import StringIO
+        from baiji.serialization import csv
+
+        rows = csv.iterload(StringIO('foo,bar\n1,2\n3\n'))
+        self.assertEqual(next(rows), {'foo': '1', 'bar': '2'})
+        with self.assertRaises(ValueError) as ctx:
+            next(rows)
+        self.assertEqual(str(ctx.exception), 'Header row contains 2 items but line 3 contains 1')
+
     def test_collection_csv_serializer_renders_correct_rows(self):
         from baiji.serialization.csv import CSVCollectionSerializer
 
@@ -50,3 +115,35 @@ class TestCSV(unittest.TestCase):
         ]
 
         self.assertEqual(serializer.render(), expected)
+
+    def test_collection_csv_serializer_streams_generator(self):
+        from StringIO import StringIO
+        from baiji.serialization.csv import CSVCollectionSerializer
+
+        serializer = CSVCollectionSerializer(
+            {'foo': 'baz%d' % i, 'bar': 'inga%d' % i} for i in range(3)
+        )
+        io = StringIO()
+        serializer.dump(io)
+        self.assertEqual(io.getvalue(), 'bar,foo\r\ninga0,baz0\r\ninga1,baz1\r\ninga2,baz2\r\n')
+
+    def test_csv_serializer_dump_uses_overridden_render(self):
+        from StringIO import StringIO
+        from baiji.serialization.csv import CSVSerializer
+
+        class CustomSerializer(CSVSerializer):
+            def render(self):
+                return [['custom']] + self.body
+
+        io = StringIO()
+        CustomSerializer([[1, 2]]).dump(io)
+        self.assertEqual(io.getvalue(), 'custom\r\n1,2\r\n')
+
+    def test_collection_csv_serializer_checks_streamed_keys(self):
+        from StringIO import StringIO
+        from baiji.serialization.csv import CSVCollectionSerializer
+
+        serializer = CSVCollectionSerializer(iter([{'foo': 1}, {'bar': 2}]))
+        self.assertRaises(ValueError, serializer.dump, StringIO())
+        self.assertRaises(ValueError, CSVCollectionSerializer, iter([]))
+        self.assertRaises(ValueError, CSVCollectionSerializer, [{'foo': 1}, {'bar': 2}])
@@ -120,4 +120,258 @@ class TestJson(unittest.TestCase):
         import scipy.sparse as sp
         self.assertEqual(
             json.dumps({"foo": sp.eye(3)}),
-            r'{"foo": {"format": "dia", "dtype": "float64", "shape": [3, 3], "__scipy.sparse.sparsematrix__": true, "data": {"dtype": "float64", "shape": [3], "__ndarray__": [1.0, 1.0, 1.0]}, "col": {"dtype": "int32", "shape": [3], "__ndarray__": [0, 1, 2]}, "row": {"dtype": "int32", "shape": [3], "__ndarray__": [0, 1, 2]}}}')
+            r'{"foo": {"shape": [3, 3], "__scipy.sparse.sparsematrix__": true, "format": "dia", "dtype": "float64", "offsets": {"dtype": "int32", "shape": [1], "__ndarray__": [0]}, "data": {"dtype": "float64", "shape": [1, 3], "__ndarray__": [[1.0, 1.0, 1.0]]}}}')
+
+    def test_json_sparse_matrix_round_trip(self):
+        import numpy as np
+        import scipy.sparse as sp
+        dense = np.array([[1., 0., 2., 0.], [0., 0., 3., 0.], [4., 0., 0., 5.], [0., 6., 0., 0.]], dtype=np.float32)
+        for matrix_format in ['csr', 'csc', 'bsr', 'dia', 'coo', 'lil']:
+            original = sp.csr_matrix(dense).asformat(matrix_format)
+            for binary in [False, True]:
+                res = json.loads(json.dumps({'foo': original}, binary=binary))['foo']
+                self.assertEqual(res.getformat(), matrix_format)
+                self.assertEqual(res.dtype, np.float32)
+                np.testing.assert_array_equal(res.todense(), dense)
+        bsr = sp.bsr_matrix(dense, blocksize=(2, 2))
+        self.assertEqual(json.loads(json.dumps(bsr)).blocksize, (2, 2))
+
+    def test_json_sparse_matrix_stores_native_arrays(self):
+        import numpy as np
+        import scipy.sparse as sp
+
+        class RawSparseDecoder(json.JSONDecoder):
+            def decode_scipy(self, dct):
+                pass
+
+        original = sp.csr_matrix(np.eye(3))
+        raw = json.loads(json.dumps(original), decoder=RawSparseDecoder())
+        self.assertEqual(sorted(raw), ['__scipy.sparse.sparsematrix__', 'data', 'dtype', 'format', 'indices', 'indptr', 'shape'])
+        np.testing.assert_array_equal(raw['indptr'], original.indptr)
+
+    def test_json_load_legacy_coo_sparse_matrix(self):
+        import numpy as np
+        import scipy.sparse as sp
+        res = json.loads(r'{"format": "csr", "dtype": "float64", "shape": [2, 3], "__scipy.sparse.sparsematrix__": true, "data": {"dtype": "float64", "shape": [2], "__ndarray__": [1.0, 2.0]}, "col": {"dtype": "int32", "shape": [2], "__ndarray__": [2, 0]}, "row": {"dtype": "int32", "shape": [2], "__ndarray__": [0, 1]}}')
+        self.assertIsInstance(res, sp.csr_matrix)
+        np.testing.assert_array_equal(res.todense(), [[0., 0., 1.], [2., 0., 0.]])
+
+    def test_json_dump_ndarray_binary_option(self):
+        import numpy as np
+        self.assertEqual(
+            json.dumps({"foo": np.array([[859.0, 859.0], [217.0, 106.0], [302.0, 140.0]], dtype='<f4')}, binary=True, sort_keys=True),
+            r'{"foo": {"__ndarray__": "AMBWRADAVkQAAFlDAADUQgAAl0MAAAxD", "byteorder": "<", "dtype": "float32", "encoding": "base64", "shape": [3, 2]}}')
+
+    def test_json_load_ndarray_binary(self):
+        import numpy as np
+        res = json.loads(r'{"foo": {"__ndarray__": "AMBWRADAVkQAAFlDAADUQgAAl0MAAAxD", "byteorder": "<", "dtype": "float32", "encoding": "base64", "shape": [3, 2]}}')
+        res_array = res["foo"]
+        self.assertIsInstance(res_array, np.ndarray)
+        self.assertEqual(res_array.shape, (3, 2))
+        self.assertEqual(res_array.dtype, np.float32)
+        np.testing.assert_equal(res_array, np.array([[859.0, 859.0], [217.0, 106.0], [302.0, 140.0]]))
+        res_array[0, 0] = 0.0 # Should be writable
+
+    def test_json_ndarray_binary_round_trip(self):
+        import numpy as np
+        for original in [
+                np.arange(12, dtype='>i8').reshape(3, 4),
+                np.arange(12, dtype=np.float64).reshape(3, 4).T,
+                np.array([True, False, True]),
+                np.array(7, dtype=np.uint16),
+        ]:
+            res = json.loads(json.dumps(original, binary=True))
+            self.assertEqual(res.shape, original.shape)
+            self.assertEqual(res.dtype, original.dtype)
+            np.testing.assert_array_equal(res, original)
+
+    def test_json_dump_large_arrays_to_blob(self):
+        import numpy as np
+        path = os.path.join(self.tmp_dir, "test_json_dump_large_arrays_to_blob.json")
+        big = np.arange(1000, dtype=np.float32).reshape(250, 4)
+        small = np.arange(3, dtype=np.int64)
+        json.dump({'big': big, 'small': small, 'big_again': big.astype('>i2')}, path, blob_threshold=1000)
+        self.assertTrue(os.path.exists(path + json.BLOB_EXTENSION))
+        with open(path, 'r') as f:
+            raw = json.loads(f.read(), decoder=dict)
+        self.assertEqual(raw['big']['__ndarray_ref__'], 'test_json_dump_large_arrays_to_blob.json.blob')
+        self.assertEqual(raw['big']['offset'] % json.BLOB_ALIGNMENT, 0)
+        self.assertEqual(raw['big_again']['offset'] % json.BLOB_ALIGNMENT, 0)
+        self.assertIn('__ndarray__', raw['small'])
+
+        res = json.load(path)
+        np.testing.assert_array_equal(res['big'], big)
+        self.assertEqual(res['big'].dtype, np.float32)
+        np.testing.assert_array_equal(res['big_again'], big)
+        self.assertEqual(res['big_again'].dtype, np.dtype('>i2'))
+        np.testing.assert_array_equal(res['small'], small)
+
+    def test_json_load_blob_from_file_object_needs_base_path(self):
+        import numpy as np
+        path = os.path.join(self.tmp_dir, "test_json_load_blob_from_file_object.json")
+        json.dump({'big': np.ones(100)}, path, blob_threshold=0)
+        with open(path, 'r') as f:
+            self.assertRaises(ValueError, json.load, f)
+        with open(path, 'r') as f:
+            np.testing.assert_array_equal(json.load(f, base_path=path)['big'], np.ones(100))
+
+    def test_json_load_rejects_refs_outside_the_json_directory(self):
+        import numpy as np
+        secret = os.path.join(self.tmp_dir, 'secret.txt')
+        with open(secret, 'w') as f:
+            f.write('x' * 16)
+        path = os.path.join(self.tmp_dir, 'sub', 'test.json')
+        for ref in [secret, 's3://bucket/secret.txt', '../secret.txt', 'sub/../../secret.txt', '..', '']:
+            doc = json.dumps({'x': {'__ndarray_ref__': ref, 'offset': 0, 'dtype': 'uint8', 'byteorder': '|', 'shape': [16]}})
+            self.assertRaises(ValueError, json.loads, doc)
+            self.assertRaises(ValueError, json.loads, doc, base_path=path)
+        doc = json.dumps({'x': {'__ndarray_ref__': 'secret.txt', 'offset': 0, 'dtype': 'uint8', 'byteorder': '|', 'shape': [16]}})
+        self.assertRaises(ValueError, json.loads, doc)
+        np.testing.assert_array_equal(json.loads(doc, base_path=secret)['x'], np.frombuffer('x' * 16, dtype=np.uint8))
+
+    def test_json_dump_blob_is_only_created_when_needed(self):
+        import numpy as np
+        path = os.path.join(self.tmp_dir, "test_json_dump_blob_is_only_created_when_needed.json")
+        json.dump({'small': np.arange(3)}, path, blob_threshold=1000)
+        self.assertFalse(os.path.exists(path + json.BLOB_EXTENSION))
+        np.testing.assert_array_equal(json.load(path)['small'], np.arange(3))
+
+    def test_json_dump_blob_leaves_the_encoder_as_it_was(self):
+        import numpy as np
+        path = os.path.join(self.tmp_dir, "test_json_dump_blob_leaves_the_encoder_as_it_was.json")
+        encoder = json.JSONEncoder()
+        json.dump({'big': np.ones(100)}, path, encoder=encoder, blob_threshold=0)
+        self.assertIsNone(encoder.blob)
+        self.assertIn('__ndarray__', json.dumps(np.ones(100), encoder=encoder))
+        np.testing.assert_array_equal(json.load(path)['big'], np.ones(100))
+
+    def test_json_dump_blob_sparse_matrix(self):
+        import numpy as np
+        import scipy.sparse as sp
+        path = os.path.join(self.tmp_dir, "test_json_dump_blob_sparse_matrix.json")
+        original = sp.rand(50, 50, density=0.2, format='csr')
+        json.dump({'foo': original}, path, blob_threshold=0)
+        res = json.load(path)['foo']
+        self.assertEqual(res.format, 'csr')
+        np.testing.assert_array_equal(res.todense(), original.todense())
+
+    def test_json_load_blob_mmap(self):
+        import numpy as np
+        path = os.path.join(self.tmp_dir, "test_json_load_blob_mmap.json")
+        big = np.arange(1000, dtype=np.float32).reshape(250, 4)
+        json.dump({'big': big, 'scalar': np.array(3.5), 'empty': np.zeros((0, 3))}, path, blob_threshold=0)
+        res = json.load(path, mmap=True)
+        self.assertIsInstance(res['big'], np.memmap)
+        np.testing.assert_array_equal(res['big'], big)
+        self.assertEqual(res['scalar'], 3.5)
+        self.assertEqual(res['empty'].shape, (0, 3))
+        self.assertNotIsInstance(json.load(path)['big'], np.memmap)
+
+    def test_json_dump_numpy_scalars(self):
+        import numpy as np
+        self.assertEqual(
+            json.dumps([np.float32(1.5), np.int64(2), np.uint8(3), np.bool_(True), np.float64(4.0)]),
+            r'[1.5, 2, 3, true, 4.0]')
+
+    def test_json_encoder_subclass_encode(self):
+        import numpy as np
+
+        class Point(object):
+            def __init__(self, x, y):
+                self.x, self.y = x, y
+
+        class Scaled(np.ndarray):
+            pass
+
+        class PointEncoder(json.JSONEncoder):
+            def encode(self, obj):
+                if isinstance(obj, Point):
+                    return {'x': obj.x, 'y': obj.y}
+
+        self.assertEqual(
+            json.dumps([Point(1, 2), np.int32(3), np.zeros(2).view(Scaled), Point(4, 5)], encoder=PointEncoder(), sort_keys=True),
+            r'[{"x": 1, "y": 2}, 3, {"__ndarray__": [0.0, 0.0], "dtype": "float64", "shape": [2]}, {"x": 4, "y": 5}]')
+
+    def test_json_decoder_skips_dicts_without_markers(self):
+        decoder = json.JSONDecoder()
+        self.assertIsNotNone(decoder.marker_keys)
+        self.assertEqual(
+            json.loads('[{"a": 1}, {"b": {"c": 2}}]', decoder=decoder),
+            [{'a': 1}, {'b': {'c': 2}}])
+
+    def test_json_decoder_subclass_decode_sees_every_dict(self):
+        class PointDecoder(json.JSONDecoder):
+            def decode(self, dct):
+                if set(dct.keys()) == set(['x', 'y']):
+                    return (dct['x'], dct['y'])
+
+        res = json.loads('{"points": [{"x": 1, "y": 2}], "foo": {"__ndarray__": [1, 2], "dtype": "int64", "shape": [2]}}', decoder=PointDecoder())
+        self.assertEqual(res['points'], [(1, 2)])
+        self.assertEqual(res['foo'].tolist(), [1, 2])
+
+    def test_json_iterload_array(self):
+        import numpy as np
+        path = os.path.join(self.tmp_dir, "test_json_iterload_array.json")
+        records = [{'id': i, 'name': u'record %d' % i, 'values': np.arange(i)} for i in range(50)] + [12345, 1.5e10, None, u'\u1234']
+        json.dump(records, path, indent=2)
+        for chunk_size in range(1, 10) + [1000]:
+            res = list(json.iterload(path, chunk_size=chunk_size))
+            self.assertEqual(len(res), len(records))
+            for expected, actual in zip(records[:50], res[:50]):
+                self.assertEqual(actual['id'], expected['id'])
+                self.assertEqual(actual['name'], expected['name'])
+                np.testing.assert_array_equal(actual['values'], expected['values'])
+            self.assertEqual(res[50:], records[50:])
+
+    def test_json_iterload_object_values(self):
+        from StringIO import StringIO
+        io = StringIO(' {"a": [1, 2], "b": {"c": 3}, "d": 4} ')
+        self.assertEqual(list(json.iterload(io, chunk_size=2)), [[1, 2], {u'c': 3}, 4])
+        self.assertEqual(list(json.iterload(StringIO('[]'))), [])
+        self.assertEqual(list(json.iterload(StringIO('{ }'))), [])
+
+    def test_json_iterload_malformed(self):
+        from StringIO import StringIO
+        for malformed in ['', '3', '[1, 2', '[1 2]', '{"a" 1}', '{1: 2}', '[1] [2]', '[1, {"a": ]']:
+            self.assertRaises(ValueError, list, json.iterload(StringIO(malformed), chunk_size=3))
+
+    def test_json_dump_iter(self):
+        import numpy as np
+        from StringIO import StringIO
+        records = [{'id': i, 'values': np.arange(i)} for i in range(5)]
+        io = StringIO()
+        json.dump_iter((record for record in records), io, sort_keys=True)
+        self.assertEqual(io.getvalue(), json.dumps(records, sort_keys=True))
+
+        io = StringIO()
+        json.dump_iter(iter([]), io)
+        self.assertEqual(io.getvalue(), '[]')
+
+        io = StringIO()
+        json.dump_iter(xrange(3), io, separators=(',', ':'))
+        self.assertEqual(io.getvalue(), '[0,1,2]')
+
+    def test_json_dump_iter_indent(self):
+        from StringIO import StringIO
+        records = [1, {'a': 2, 'b': [3, 'x\ny']}, []]
+        for indent in [2, '\t']:
+            io = StringIO()
+            json.dump_iter(iter(records), io, indent=indent, sort_keys=True)
+            self.assertEqual(io.getvalue(), json.dumps(records, indent=indent, sort_keys=True))
+        io = StringIO()
+        json.dump_iter(iter([]), io, indent=2)
+        self.assertEqual(io.getvalue(), json.dumps([], indent=2))
+
+    def test_json_dump_iter_blob(self):
+        import numpy as np
+        path = os.path.join(self.tmp_dir, "test_json_dump_iter_blob.json")
+        json.dump_iter((np.arange(100) * i for i in range(3)), path, blob_threshold=100)
+        self.assertTrue(os.path.exists(path + json.BLOB_EXTENSION))
+        res = json.load(path)
+        for i in range(3):
+            np.testing.assert_array_equal(res[i], np.arange(100) * i)
+
+    def test_json_dump_iter_path(self):
+        path = os.path.join(self.tmp_dir, "test_json_dump_iter_path.json")
+        json.dump_iter(({'id': i} for i in range(3)), path)
+        self.assertEqual(json.load(path), [{'id': 0}, {'id': 1}, {'id': 2}])
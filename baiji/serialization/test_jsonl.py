@@ -0,0 +1,52 @@
+import unittest
+import os
+from baiji.serialization import jsonl
+
+class TestJsonl(unittest.TestCase):
+
+    def setUp(self):
+        import tempfile
+        self.tmp_dir = tempfile.mkdtemp('baiji-serialization-jsonl')
+
+    def tearDown(self):
+        import shutil
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+
+    def test_jsonl_dumps(self):
+        self.assertEqual(
+            jsonl.dumps([{'foo': 1}, ['bar', None], 'baz']),
+            '{"foo": 1}\n["bar", null]\n"baz"\n')
+
+    def test_jsonl_loads(self):
+        self.assertEqual(
+            jsonl.loads('{"foo": 1}\n\n["bar", null]\n"baz"'),
+            [{u'foo': 1}, [u'bar', None], u'baz'])
+
+    def test_jsonl_dumps_refuses_indent(self):
+        self.assertRaises(ValueError, jsonl.dumps, [{'foo': 1}], indent=2)
+
+    def test_jsonl_round_trip_path(self):
+        import numpy as np
+        path = os.path.join(self.tmp_dir, "test_jsonl_round_trip_path.jsonl")
+        jsonl.dump(({'id': i, 'values': np.arange(i)} for i in range(10)), path)
+        res = jsonl.load(path)
+        self.assertEqual([r['id'] for r in res], range(10))
+        for i, record in enumerate(res):
+            np.testing.assert_array_equal(record['values'], np.arange(i))
+
+    def test_jsonl_parallel_load_matches_serial(self):
+        import numpy as np
+        from baiji.serialization import json
+        path = os.path.join(self.tmp_dir, "test_jsonl_parallel_load.jsonl")
+        jsonl.dump(({'id': i, 'values': np.arange(i % 7)} for i in range(1000)), path)
+        serial = jsonl.load(path)
+        parallel = jsonl.load(path, processes=3, chunk_size=500, decoder=json.JSONDecoder)
+        self.assertEqual([r['id'] for r in parallel], range(1000))
+        for expected, actual in zip(serial, parallel):
+            np.testing.assert_array_equal(actual['values'], expected['values'])
+
+    def test_jsonl_iterload_file(self):
+        from StringIO import StringIO
+        records = jsonl.iterload(StringIO('1\n2\n3\n'), chunk_size=1)
+        self.assertEqual(next(records), 1)
+        self.assertEqual(list(records), [2, 3])
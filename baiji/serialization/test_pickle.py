@@ -0,0 +1,150 @@
+import unittest
+import os
+from baiji.serialization import pickle
+
+class TestPickle(unittest.TestCase):
+
+    def setUp(self):
+        import tempfile
+        self.tmp_dir = tempfile.mkdtemp('baiji-serialization-pickle')
+
+    def tearDown(self):
+        import shutil
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+
+    def build_obj(self):
+        import numpy as np
+        self.big = np.random.rand(200, 100)
+        self.obj = {
+            'big': self.big,
+            'again': self.big,
+            'fortran': np.asfortranarray(np.arange(20000.).reshape(200, 100)),
+            'strided': self.big[:, ::2],
+            'big_endian': np.arange(20000, dtype='>i4'),
+            'small': np.arange(3),
+            'other': [u'foo', (1, 2)],
+        }
+
+    def assert_loaded(self, res):
+        import numpy as np
+        self.assertEqual(sorted(res.keys()), sorted(self.obj.keys()))
+        self.assertIs(res['big'], res['again'])
+        self.assertEqual(res['other'], self.obj['other'])
+        for k in ['big', 'fortran', 'strided', 'big_endian', 'small']:
+            np.testing.assert_array_equal(res[k], self.obj[k])
+            self.assertEqual(res[k].dtype.name, self.obj[k].dtype.name)
+
+    def test_pickle_out_of_band_round_trip(self):
+        self.build_obj()
+        for name in ['test.pkl', 'test.pkl.gz']:
+            path = os.path.join(self.tmp_dir, name)
+            pickle.dump(self.obj, path, out_of_band=True)
+            self.assert_loaded(pickle.load(path))
+
+    def test_pickle_out_of_band_keeps_arrays_out_of_the_pickle(self):
+        self.build_obj()
+        path = os.path.join(self.tmp_dir, 'test.pkl')
+        pickle.dump(self.obj, path, out_of_band=True)
+        with open(path, 'rb') as f:
+            self.assertEqual(f.read(len(pickle.MAGIC)), pickle.MAGIC)
+        in_band = os.path.join(self.tmp_dir, 'in_band.pkl')
+        pickle.dump(self.obj, in_band)
+        # The shared array is stored once either way
+        self.assertLess(abs(os.path.getsize(path) - os.path.getsize(in_band)), 2 * 1024)
+
+    def test_pickle_out_of_band_mmap(self):
+        import numpy as np
+        self.build_obj()
+        path = os.path.join(self.tmp_dir, 'test.pkl')
+        pickle.dump(self.obj, path, out_of_band=True)
+        res = pickle.load(path, mmap=True)
+        self.assert_loaded(res)
+        self.assertIsInstance(res['big'], np.memmap)
+        self.assertEqual(res['big_endian'].dtype, np.dtype('>i4'))
+        self.assertTrue(res['fortran'].flags.f_contiguous)
+        self.assertFalse(res['big'].flags.writeable)
+
+    def test_pickle_out_of_band_mmap_after_other_data(self):
+        import numpy as np
+        path = os.path.join(self.tmp_dir, 'offset.pkl')
+        big = np.arange(10000, dtype=np.float64)
+        with open(path, 'wb') as f:
+            f.write('12345678')
+            pickle.dump({'big': big, 'small': np.arange(3)}, f, out_of_band=True)
+        for mmap in [False, True]:
+            with open(path, 'rb') as f:
+                f.read(8)
+                res = pickle.load(f, mmap=mmap)
+            self.assertEqual(isinstance(res['big'], np.memmap), mmap)
+            np.testing.assert_array_equal(res['big'], big)
+            np.testing.assert_array_equal(res['small'], np.arange(3))
+
+    def test_pickle_loads_out_of_band_and_legacy(self):
+        from cStringIO import StringIO
+        self.build_obj()
+        output = StringIO()
+        pickle._dump(output, self.obj, out_of_band=True) # pylint: disable=protected-access
+        self.assert_loaded(pickle.loads(output.getvalue()))
+        self.assert_loaded(pickle.loads(pickle.dumps(self.obj)))
+
+    def test_pickle_load_legacy_compressed(self):
+        # Decompressed files can't seek back over the bytes read to check
+        # for MAGIC
+        self.build_obj()
+        path = os.path.join(self.tmp_dir, 'test.pkl.gz')
+        pickle.dump(self.obj, path)
+        self.assert_loaded(pickle.load(path))
+
+    def test_pickle_load_with_constructors(self):
+        from collections import OrderedDict
+        dumped = pickle.dumps([OrderedDict(a=1), set([1])])
+        res = pickle.loads(dumped)
+        self.assertEqual(res, [OrderedDict(a=1), set([1])])
+        from cStringIO import StringIO
+        res = pickle._load(StringIO(dumped), constructors={'collections.OrderedDict': dict}) # pylint: disable=protected-access
+        self.assertIs(type(res[0]), dict)
+        self.assertEqual(res[1], set([1]))
+        # A changed mapping is honored by the next load
+        res = pickle._load(StringIO(dumped), constructors={'collections.OrderedDict': list}) # pylint: disable=protected-access
+        self.assertEqual(res[0], [['a', 1]])
+
+    def test_pickle_load_with_constructors_sees_patched_modules(self):
+        import sys
+        import types
+        from cStringIO import StringIO
+        module = types.ModuleType('baiji_serialization_test_patched')
+        class Original(object):
+            pass
+        class Patched(object):
+            pass
+        Original.__module__ = Patched.__module__ = module.__name__
+        Original.__name__ = Patched.__name__ = 'C'
+        module.C = Original
+        sys.modules[module.__name__] = module
+        try:
+            dumped = pickle.dumps(Original())
+            load = lambda: pickle._load(StringIO(dumped), constructors={'unused.Name': dict}) # pylint: disable=protected-access
+            self.assertIs(type(load()), Original)
+            module.C = Patched
+            self.assertIs(type(load()), Patched)
+            # As is a module which is replaced, as reload does
+            reloaded = types.ModuleType(module.__name__)
+            reloaded.C = Original
+            sys.modules[module.__name__] = reloaded
+            self.assertIs(type(load()), Original)
+            self.assertIs(pickle._resolved_globals[(module.__name__, 'C')][0], reloaded) # pylint: disable=protected-access
+        finally:
+            del sys.modules[module.__name__]
+
+    def test_pickle_load_with_module_renames(self):
+        from cStringIO import StringIO
+        from collections import OrderedDict
+        # Pretend OrderedDict was pickled from a package which has moved
+        dumped = pickle.dumps(OrderedDict(a=1)).replace('collections', 'legacy_pkg.sub')
+        load = lambda **kwargs: pickle._load(StringIO(dumped), **kwargs) # pylint: disable=protected-access
+        self.assertRaises(ImportError, load)
+        self.assertEqual(load(module_renames={'legacy_pkg.sub': 'collections', 'legacy_pkg': 'nowhere'}), OrderedDict(a=1))
+        self.assertRaises(ImportError, load, module_renames={'legacy_pkg': 'nowhere'})
+        self.assertEqual(
+            load(module_renames={'legacy_pkg.sub': 'nowhere'}, constructors={'legacy_pkg.sub.OrderedDict': OrderedDict}),
+            OrderedDict(a=1))
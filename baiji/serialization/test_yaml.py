@@ -1,3 +1,4 @@
+from __future__ import absolute_import
 import unittest
 from baiji.serialization import yaml
 
@@ -7,6 +8,18 @@ class UnsafeToDump(object):
 
 unsafe_to_load = "!!python/name:baiji.serialization.test_yaml.UnsafeToDump ''\n"
 
+class Registered(object):
+    def __init__(self, value):
+        self.value = value
+    def __eq__(self, other):
+        return isinstance(other, Registered) and other.value == self.value
+
+def represent_registered(dumper, data):
+    return dumper.represent_scalar(u'!registered', unicode(data.value))
+
+def construct_registered(loader, node):
+    return Registered(int(loader.construct_scalar(node)))
+
 class TestYAML(unittest.TestCase):
 
     def test_yaml_unsafe_dumps(self):
@@ -24,3 +37,197 @@ class TestYAML(unittest.TestCase):
         self.assertRaises(
             yaml.SerializationSafetyError,
             yaml.loads, unsafe_to_load, safe=True)
+
+    def test_yaml_pure_python_matches_libyaml(self):
+        import warnings
+        obj = {'foo': [1, 2.5, None, True], 'bar': u'\u1234', 'baz': {'nested': 'str'}}
+        results = []
+        for use_libyaml in (True, False):
+            yaml.USE_LIBYAML = use_libyaml
+            try:
+                with warnings.catch_warnings():
+                    warnings.simplefilter('ignore', DeprecationWarning)
+                    results.append((
+                        yaml.loads(yaml.dumps(obj)),
+                        yaml.dumps(UnsafeToDump),
+                        yaml.loads(unsafe_to_load),
+                    ))
+            finally:
+                yaml.USE_LIBYAML = True
+        self.assertEqual(results[0], results[1])
+        self.assertEqual(results[0][0], obj)
+
+    def test_yaml_safe_load_uses_libyaml_when_available(self):
+        import yaml as pyyaml
+        if not hasattr(pyyaml, 'CSafeLoader'):
+            self.skipTest('LibYAML is not installed')
+        self.assertIs(yaml._loader_class(), pyyaml.CSafeLoader) # pylint: disable=protected-access
+        self.assertIs(yaml._dumper_class(safe=True), pyyaml.CSafeDumper) # pylint: disable=protected-access
+        yaml.USE_LIBYAML = False
+        try:
+            self.assertIs(yaml._loader_class(), pyyaml.SafeLoader) # pylint: disable=protected-access
+        finally:
+            yaml.USE_LIBYAML = True
+
+    def test_yaml_uses_registered_implicit_resolvers(self):
+        import re
+        import yaml as pyyaml
+        original = pyyaml.SafeLoader.__dict__.get('yaml_implicit_resolvers')
+        pyyaml.SafeLoader.add_implicit_resolver(u'tag:yaml.org,2002:null', re.compile(u'^~~$'), [u'~'])
+        try:
+            for use_libyaml in (True, False):
+                yaml.USE_LIBYAML = use_libyaml
+                self.assertEqual(yaml.loads('a: ~~\n', safe=True), {'a': None})
+        finally:
+            yaml.USE_LIBYAML = True
+            if original is None:
+                del pyyaml.SafeLoader.yaml_implicit_resolvers
+            else:
+                pyyaml.SafeLoader.yaml_implicit_resolvers = original
+        self.assertEqual(yaml.loads('a: ~~\n', safe=True), {'a': '~~'})
+
+    def restore_after_test(self, cls, table):
+        original = cls.__dict__.get(table)
+        def restore():
+            if original is None:
+                delattr(cls, table)
+            else:
+                setattr(cls, table, original)
+        self.addCleanup(restore)
+
+    def assert_in_both_modes(self, fn):
+        try:
+            for use_libyaml in (True, False):
+                yaml.USE_LIBYAML = use_libyaml
+                fn()
+        finally:
+            yaml.USE_LIBYAML = True
+
+    def test_yaml_uses_representers_added_to_dumper(self):
+        import warnings
+        import yaml as pyyaml
+        self.restore_after_test(pyyaml.Dumper, 'yaml_representers')
+        pyyaml.add_representer(Registered, represent_registered)
+        def check():
+            with warnings.catch_warnings(record=True) as w:
+                warnings.simplefilter('always')
+                dumped = yaml.dumps(Registered(3))
+            self.assertEqual([x.category for x in w], [DeprecationWarning])
+            self.assertTrue(dumped.startswith('!registered '))
+        self.assert_in_both_modes(check)
+
+    def test_yaml_uses_constructors_added_to_loader(self):
+        import yaml as pyyaml
+        self.restore_after_test(pyyaml.Loader, 'yaml_constructors')
+        pyyaml.add_constructor(u'!registered', construct_registered)
+        def check():
+            self.assertEqual(yaml.loads('!registered 5', safe=False), Registered(5))
+            with self.assertRaises(yaml.SerializationSafetyError):
+                yaml.loads('!registered 5', safe=True)
+        self.assert_in_both_modes(check)
+
+    def test_yaml_uses_representers_added_to_safe_dumper(self):
+        import yaml as pyyaml
+        self.restore_after_test(pyyaml.SafeDumper, 'yaml_representers')
+        pyyaml.SafeDumper.add_representer(Registered, represent_registered)
+        def check():
+            self.assertTrue(yaml.dumps(Registered(3), safe=True).startswith('!registered '))
+        self.assert_in_both_modes(check)
+
+    def test_yaml_uses_constructors_added_to_safe_loader(self):
+        import yaml as pyyaml
+        self.restore_after_test(pyyaml.SafeLoader, 'yaml_constructors')
+        pyyaml.SafeLoader.add_constructor(u'!registered', construct_registered)
+        def check():
+            self.assertEqual(yaml.loads('!registered 5', safe=True), Registered(5))
+        self.assert_in_both_modes(check)
+
+    def test_yaml_unsafe_load_from_file_object(self):
+        import warnings
+        from StringIO import StringIO
+        with warnings.catch_warnings(record=True) as w:
+            warnings.simplefilter('always')
+            result = yaml.load(StringIO('foo: ' + unsafe_to_load))
+        self.assertEqual(result, {'foo': UnsafeToDump})
+        self.assertEqual([x.category for x in w], [DeprecationWarning])
+
+    def test_yaml_unsafe_round_trip(self):
+        import warnings
+        obj = {'cls': UnsafeToDump, 'name': u'foo', 'values': (1, 2)}
+        with warnings.catch_warnings(record=True) as w:
+            warnings.simplefilter('always')
+            dumped = yaml.dumps(obj)
+        self.assertEqual([x.category for x in w], [DeprecationWarning])
+        self.assertEqual(yaml.loads(dumped, safe=False), obj)
+
+    def test_yaml_safe_round_trip_does_not_warn(self):
+        import warnings
+        with warnings.catch_warnings(record=True) as w:
+            warnings.simplefilter('always')
+            self.assertEqual(yaml.loads(yaml.dumps({'foo': [1, 'bar']})), {'foo': [1, 'bar']})
+            self.assertEqual(yaml.dumps(UnsafeToDump, safe=False), unsafe_to_load)
+        self.assertEqual(w, [])
+
+    def test_yaml_numpy_round_trip_is_safe(self):
+        import numpy as np
+        obj = {
+            'float': np.arange(6.).reshape(2, 3),
+            'empty': np.zeros((0, 3), dtype=np.int16),
+            'big_endian': np.arange(4, dtype='>u4'),
+            'strings': np.array(['foo', 'ba']),
+            'scalar': np.array('foo'),
+            'bools': np.array([True, False]),
+            'complex': np.arange(4).reshape(2, 2) * (1+2j),
+            'complex64': np.array([1.5-1j, 0], dtype=np.complex64),
+            'complex_scalar': np.array(3j),
+            'dates': np.array(['2020-01-01', '2021-06-02'], dtype='datetime64[D]'),
+            'times': np.array(['2020-01-01T00:00:01.5'], dtype='datetime64[ns]'),
+        }
+        for binary in (False, True):
+            dumped = yaml.dumps(obj, safe=True, binary=binary)
+            self.assertNotIn('!!python', dumped)
+            self.assertEqual('!!binary' in dumped, binary)
+            res = yaml.loads(dumped, safe=True)
+            self.assertEqual(sorted(res.keys()), sorted(obj.keys()))
+            for k, v in obj.items():
+                np.testing.assert_array_equal(res[k], v)
+                self.assertEqual(res[k].dtype.name, v.dtype.name)
+                self.assertEqual(res[k].shape, v.shape)
+
+    def test_yaml_structured_and_masked_arrays_round_trip_unsafely(self):
+        import warnings
+        import numpy as np
+        structured = np.array([(1, 2.5), (3, 4.5)], dtype=[('a', 'i4'), ('b', 'f8')])
+        masked = np.ma.masked_array([1, 2, 3], mask=[False, True, False])
+        for obj in (structured, masked):
+            with self.assertRaises(yaml.SerializationSafetyError):
+                yaml.dumps(obj, safe=True)
+            with warnings.catch_warnings(record=True) as w:
+                warnings.simplefilter('always')
+                dumped = yaml.dumps(obj)
+            self.assertEqual([x.category for x in w], [DeprecationWarning])
+            res = yaml.loads(dumped, safe=False)
+            self.assertIs(type(res), type(obj))
+            self.assertEqual(res.dtype, obj.dtype)
+            np.testing.assert_array_equal(res, obj)
+        np.testing.assert_array_equal(res.mask, masked.mask)
+
+    def test_yaml_numpy_scalars_dump_as_builtins(self):
+        import numpy as np
+        dumped = yaml.dumps([np.float32(1.5), np.int64(3), np.bool_(True)], safe=True)
+        self.assertEqual(dumped, '[1.5, 3, true]\n')
+
+    def test_yaml_dumps_to_a_stream(self):
+        from StringIO import StringIO
+        self.assertEqual(yaml.dumps({'a': 1}, None), yaml.dumps({'a': 1}))
+        stream = StringIO()
+        self.assertIsNone(yaml.dumps({'a': 1}, stream, default_flow_style=True))
+        self.assertEqual(stream.getvalue(), '{a: 1}\n')
+
+    def test_yaml_sparse_round_trip_is_safe(self):
+        import numpy as np
+        import scipy.sparse as sp
+        for matrix in [sp.csr_matrix(np.eye(3)), sp.dia_matrix(np.arange(9.).reshape(3, 3))]:
+            res = yaml.loads(yaml.dumps({'m': matrix}, safe=True, binary=True), safe=True)['m']
+            self.assertEqual(res.getformat(), matrix.getformat())
+            np.testing.assert_array_equal(res.todense(), matrix.todense())
@@ -0,0 +1,62 @@
+# Loads and dumps which run in the background, for callers such as event
+# loops which mustn't block on s3 or on decoding.
+#
+#     future = json.aload('s3://bucket/key.json')
+#     ...
+#     obj = future.result()
+#
+# Each format module's aload and adump run its load and dump in a shared
+# pool of threads, and return a concurrent.futures.Future. On an asyncio
+# loop, await asyncio.wrap_future(future). The size of the pool bounds how
+# many run at once; change it with set_max_workers, or pass executor= to
+# use another pool.
+
+import threading
+
+DEFAULT_MAX_WORKERS = 8
+
+_executor = None
+_max_workers = DEFAULT_MAX_WORKERS
+_lock = threading.Lock()
+
+
+def _futures():
+    try:
+        from concurrent import futures
+    except ImportError:
+        raise ImportError("install futures to use aload and adump")
+    return futures
+
+
+def set_max_workers(max_workers):
+    '''
+    Set the number of loads and dumps which run at once. Those already
+    submitted finish in the previous pool.
+    '''
+    global _executor, _max_workers # pylint: disable=global-statement
+    if max_workers < 1:
+        raise ValueError('max_workers should be at least 1')
+    with _lock:
+        previous, _executor, _max_workers = _executor, None, max_workers
+    if previous is not None:
+        previous.shutdown(wait=False)
+
+
+def executor():
+    '''
+    Return the shared pool, creating it the first time.
+    '''
+    global _executor # pylint: disable=global-statement
+    with _lock:
+        if _executor is None:
+            _executor = _futures().ThreadPoolExecutor(max_workers=_max_workers)
+        return _executor
+
+
+def submit(fn, *args, **kwargs):
+    '''
+    Call fn(*args, **kwargs) in the pool given as the keyword argument
+    executor, or else the shared pool, and return a Future of its result.
+    '''
+    pool = kwargs.pop('executor', None) or executor()
+    return pool.submit(fn, *args, **kwargs)
@@ -0,0 +1,155 @@
+# An opt-in, on-disk cache for files loaded from s3.
+#
+#     from baiji.serialization.util import cache
+#     cache.enable('/tmp/baiji-cache', max_bytes=10 * 1024 ** 3)
+#
+# Once enabled, every format module's load, from an s3:// path, checks the
+# key's ETag and reads a local copy when it has one for that ETag. Copies
+# are evicted least-recently-used first, once the directory exceeds
+# max_bytes.
+
+DEFAULT_MAX_BYTES = 1024 ** 3
+
+_current = None
+
+
+def enable(directory, max_bytes=DEFAULT_MAX_BYTES, memoize=0):
+    '''
+    directory: Where to keep the local copies. It can be shared between
+      processes.
+    max_bytes: The size the directory is trimmed back to after each download.
+    memoize: When nonzero, also keep this many decoded results in memory, so
+      a repeated load of an unchanged key with the same arguments returns the
+      same object. Only use this for inputs which are never mutated.
+    '''
+    global _current # pylint: disable=global-statement
+    _current = RemoteCache(directory, max_bytes=max_bytes, memoize=memoize)
+    return _current
+
+
+def disable():
+    global _current # pylint: disable=global-statement
+    _current = None
+
+
+def current():
+    '''
+    Return the enabled RemoteCache, or None.
+    '''
+    return _current
+
+
+def applies_to(path_or_fp, mode):
+    if _current is None or not isinstance(path_or_fp, basestring) or 'r' not in mode:
+        return False
+    from baiji import path as s3path
+    return s3path.isremote(path_or_fp)
+
+
+class RemoteCache(object):
+    def __init__(self, directory, max_bytes=DEFAULT_MAX_BYTES, memoize=0):
+        import os
+        import threading
+        from collections import OrderedDict
+        from baiji.util.shutillib import mkdir_p
+        self.directory = os.path.abspath(directory)
+        self.max_bytes = max_bytes
+        self.memoize = memoize
+        self.memo = OrderedDict()
+        self.lock = threading.Lock()
+        mkdir_p(self.directory)
+
+    def version(self, path):
+        from baiji import s3
+        return s3.etag(path)
+
+    def local_path(self, path, version):
+        import os
+        import hashlib
+        key = hashlib.sha1('{}\0{}'.format(path, version)).hexdigest()
+        return os.path.join(self.directory, key)
+
+    def fetch(self, path, version=None):
+        '''
+        Return the path of a local copy of path, downloading it if there
+        isn't one for its current version.
+        '''
+        import os
+        import tempfile
+        from baiji import s3
+        if version is None:
+            version = self.version(path)
+        local_path = self.local_path(path, version)
+        if os.path.exists(local_path):
+            # Modification time records the last use, for eviction
+            os.utime(local_path, None)
+            return local_path
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, prefix='.download-')
+        os.close(fd)
+        try:
+            s3.cp(path, tmp_path, force=True)
+            os.rename(tmp_path, local_path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        self.evict(keep=local_path)
+        return local_path
+
+    def evict(self, keep=None):
+        import os
+        entries = []
+        for name in os.listdir(self.directory):
+            if name.startswith('.'):
+                continue
+            entry_path = os.path.join(self.directory, name)
+            try:
+                stat = os.stat(entry_path)
+            except OSError:
+                continue # Evicted by another process
+            entries.append((stat.st_mtime, stat.st_size, entry_path))
+        total = sum(size for _, size, _ in entries)
+        for _, size, entry_path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            if entry_path == keep:
+                continue
+            try:
+                os.remove(entry_path)
+            except OSError:
+                pass
+            total -= size
+
+    def call(self, path, fn, mode, compression, args, kwargs):
+        '''
+        Call fn on a local copy of path, as ensure_file_open_and_call does.
+        '''
+        from baiji.serialization.util.openlib import opened
+        from baiji.serialization.util.compression import compression_for_path
+        version = self.version(path)
+        if compression is None:
+            # The local copy has no suffix to detect it from
+            compression = compression_for_path(path)
+
+        memo_key = None
+        if self.memoize:
+            memo_key = (path, version, fn, mode, compression, args, tuple(sorted(kwargs.items())))
+            try:
+                hash(memo_key)
+            except TypeError:
+                memo_key = None
+        if memo_key is not None:
+            with self.lock:
+                if memo_key in self.memo:
+                    result = self.memo.pop(memo_key)
+                    self.memo[memo_key] = result
+                    return result
+
+        with opened(self.fetch(path, version), mode, compression or False) as f:
+            result = fn(f, *args, **kwargs)
+
+        if memo_key is not None:
+            with self.lock:
+                self.memo[memo_key] = result
+                while len(self.memo) > self.memoize:
+                    self.memo.popitem(last=False)
+        return result
@@ -0,0 +1,201 @@
+# Streaming compression for the files opened by ensure_file_open_and_call.
+#
+# Each codec is a pair of factories for objects with the interface of
+# zlib.compressobj and zlib.decompressobj, so one file wrapper serves all of
+# them.
+
+SUFFIXES = {
+    '.gz': 'gzip',
+    '.bz2': 'bz2',
+    '.xz': 'xz',
+    '.zst': 'zstd',
+}
+
+CHUNK_SIZE = 64 * 1024
+
+
+def compression_for_path(path):
+    '''
+    Return the name of the codec implied by path's suffix, or None.
+    '''
+    import os
+    return SUFFIXES.get(os.path.splitext(path)[1].lower())
+
+
+def _gzip():
+    import zlib
+    # 16 + MAX_WBITS selects the gzip container
+    return (
+        lambda: zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS),
+        lambda: zlib.decompressobj(16 + zlib.MAX_WBITS),
+    )
+
+def _bz2():
+    import bz2
+    return bz2.BZ2Compressor, bz2.BZ2Decompressor
+
+def _xz():
+    try:
+        import lzma
+    except ImportError:
+        try:
+            from backports import lzma
+        except ImportError:
+            raise ImportError("install backports.lzma to read or write xz files")
+    return lzma.LZMACompressor, lzma.LZMADecompressor
+
+def _zstd():
+    try:
+        import zstandard
+    except ImportError:
+        raise ImportError("install zstandard to read or write zstd files")
+    return (
+        lambda: zstandard.ZstdCompressor().compressobj(),
+        lambda: zstandard.ZstdDecompressor().decompressobj(),
+    )
+
+CODECS = {
+    'gzip': _gzip,
+    'bz2': _bz2,
+    'xz': _xz,
+    'zstd': _zstd,
+}
+
+
+class CompressedFile(object):
+    '''
+    Wraps a binary file object, compressing what's written to it or
+    decompressing what's read from it, a chunk at a time. Closing the
+    wrapper finishes the compressed stream but leaves the underlying file
+    open.
+
+    Concatenated streams, such as the members of a multi-member gzip file,
+    are read as one.
+    '''
+    def __init__(self, f, mode, compression):
+        try:
+            codec = CODECS[compression]
+        except KeyError:
+            raise ValueError('Unknown compression {}; expected one of {}'.format(
+                compression, ', '.join(sorted(CODECS))))
+        self.f = f
+        self.closed = False
+        self.make_compressor, self.make_decompressor = codec()
+        if 'r' in mode:
+            self.decompressor = self.make_decompressor()
+            self.compressor = None
+        else:
+            self.decompressor = None
+            self.compressor = self.make_compressor()
+        self.buf = ''
+        self.pos = 0
+        self.eof = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_value is None:
+            self.close()
+
+    def _fill(self, size=None):
+        '''
+        Decompress until at least size bytes are buffered, or to the end
+        when size is None.
+        '''
+        chunks = [self.buf[self.pos:]]
+        available = len(chunks[0])
+        while not self.eof and (size is None or available < size):
+            raw = self.f.read(CHUNK_SIZE)
+            if not raw:
+                self.eof = True
+                break
+            data = self._decompress(raw)
+            chunks.append(data)
+            available += len(data)
+        self.buf = ''.join(chunks)
+        self.pos = 0
+
+    def _decompress(self, raw):
+        result = []
+        while raw:
+            try:
+                result.append(self.decompressor.decompress(raw))
+            except EOFError:
+                # The previous stream ended exactly at the end of a chunk
+                self.decompressor = self.make_decompressor()
+                continue
+            # Anything past the end of a stream is the start of the next one
+            raw = getattr(self.decompressor, 'unused_data', '')
+            if raw:
+                self.decompressor = self.make_decompressor()
+        return ''.join(result)
+
+    def read(self, size=-1):
+        if size is None or size < 0:
+            self._fill()
+            result, self.buf = self.buf, ''
+            return result
+        if len(self.buf) - self.pos < size:
+            self._fill(size)
+        result = self.buf[self.pos:self.pos + size]
+        self.pos += len(result)
+        return result
+
+    def readline(self, size=-1):
+        while True:
+            end = self.buf.find('\n', self.pos)
+            if end != -1:
+                end += 1
+                break
+            if self.eof:
+                end = len(self.buf)
+                break
+            self._fill(len(self.buf) - self.pos + CHUNK_SIZE)
+        if size is not None and size >= 0:
+            end = min(end, self.pos + size)
+        result = self.buf[self.pos:end]
+        self.pos = end
+        return result
+
+    def readlines(self, sizehint=-1):
+        lines = []
+        total = 0
+        for line in self:
+            lines.append(line)
+            total += len(line)
+            if sizehint > 0 and total >= sizehint:
+                break
+        return lines
+
+    def __iter__(self):
+        return self
+
+    def next(self):
+        line = self.readline()
+        if not line:
+            raise StopIteration
+        return line
+
+    __next__ = next
+
+    def write(self, data):
+        self.f.write(self.compressor.compress(data))
+
+    def writelines(self, lines):
+        for line in lines:
+            self.write(line)
+
+    def flush(self):
+        # Flushing the compressor would end the stream, so only flush what's
+        # already been compressed.
+        if hasattr(self.f, 'flush'):
+            self.f.flush()
+
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        if self.compressor is not None:
+            self.f.write(self.compressor.flush())
+            self.flush()
@@ -0,0 +1,110 @@
+# Chooses the baiji.serialization module which reads and writes a path, by
+# its extension.
+#
+# The built-in formats are listed here by name, so looking one up imports
+# only that module and its dependencies. Other packages can publish format
+# modules into the baiji.serialization namespace (see its __init__); any
+# module there which defines EXTENSION, and optionally a list of
+# EXTENSIONS, is found the first time an unknown extension is looked up.
+
+# Module names in baiji.serialization, by file extension
+FORMATS_BY_EXTENSION = {
+    '.json': 'json',
+    '.jsonl': 'jsonl',
+    '.yaml': 'yaml',
+    '.yml': 'yaml',
+    '.csv': 'csv',
+    '.pkl': 'pickle',
+    '.bjson': 'bjson',
+}
+
+# Modules in the baiji.serialization namespace which aren't formats
+_NOT_FORMATS = set(['batch', 'util'])
+
+_registered = {}
+_discovered = None
+
+
+def register(extension, module_name):
+    '''
+    Read and write files ending in extension with the named module. A name
+    without a dot is taken to be in baiji.serialization.
+    '''
+    _registered[extension.lower()] = module_name
+
+
+def formats_by_extension():
+    '''
+    Return a dict mapping each known extension to its module name,
+    searching the baiji.serialization namespace for other formats.
+    '''
+    result = dict(_discover())
+    result.update(FORMATS_BY_EXTENSION)
+    result.update(_registered)
+    return result
+
+
+def module_for_format(name):
+    '''
+    Return the module for a format, e.g. 'json', or a fully qualified
+    module name.
+    '''
+    from baiji.serialization.util.importlib import module_from_str
+    if not name:
+        raise ValueError('Empty format name')
+    if '.' not in name:
+        name = 'baiji.serialization.' + name
+    return module_from_str(name)
+
+
+def module_for_path(path, format=None): # pylint: disable=redefined-builtin
+    '''
+    Return the module which reads and writes path, chosen by its extension,
+    ignoring any compression suffix. When format is given, it's used
+    instead.
+    '''
+    if format is not None:
+        return module_for_format(format)
+    if not isinstance(path, basestring):
+        raise ValueError('Pass format to read or write a file object')
+    extension = extension_for_path(path)
+    name = _registered.get(extension) or FORMATS_BY_EXTENSION.get(extension)
+    if name is None:
+        name = _discover().get(extension)
+    if name is None:
+        raise ValueError('Unable to determine the format of {}'.format(path))
+    return module_for_format(name)
+
+
+def extension_for_path(path):
+    '''
+    Return the lowercased extension of path, before any compression suffix.
+    '''
+    import os
+    from baiji.serialization.util.compression import compression_for_path
+    root, extension = os.path.splitext(path)
+    if compression_for_path(path):
+        extension = os.path.splitext(root)[1]
+    return extension.lower()
+
+
+def _discover():
+    global _discovered # pylint: disable=global-statement
+    if _discovered is None:
+        import pkgutil
+        import baiji.serialization
+        discovered = {}
+        for _, name, _ in pkgutil.iter_modules(baiji.serialization.__path__):
+            if name in FORMATS_BY_EXTENSION.values() or name in _NOT_FORMATS or name.startswith('test_'):
+                continue
+            try:
+                module = module_for_format(name)
+            except ImportError:
+                continue
+            extensions = getattr(module, 'EXTENSIONS', [])
+            if hasattr(module, 'EXTENSION'):
+                extensions = [module.EXTENSION] + list(extensions)
+            for extension in extensions:
+                discovered.setdefault(extension.lower(), name)
+        _discovered = discovered
+    return _discovered
@@ -0,0 +1,259 @@
+# Hooks for measuring loads and dumps, to find out whether a slow load is
+# spent in s3, or decoding, or in a particular decoder.
+#
+#     from baiji.serialization.util import instrumentation
+#     def report(call):
+#         print call.path, call.format, call.transfer_seconds, call.codec_seconds, call.method_counts
+#     instrumentation.add_hook(report)
+#
+# Each hook is called with a Call once every load or dump which goes through
+# ensure_file_open_and_call or ensure_file_open_and_iterate finishes, whether
+# it succeeded or not. When no hook is installed, nothing is measured.
+
+import threading
+import time
+
+_hooks = []
+_lock = threading.Lock()
+_local = threading.local()
+
+
+def add_hook(hook):
+    '''
+    hook: A callable which takes a Call. It's called on the thread which
+      made the call, so it should be thread safe.
+    '''
+    global _hooks # pylint: disable=global-statement
+    with _lock:
+        # Replace rather than mutate the list, so it can be iterated without
+        # the lock.
+        _hooks = _hooks + [hook]
+
+
+def remove_hook(hook):
+    global _hooks # pylint: disable=global-statement
+    with _lock:
+        if hook not in _hooks:
+            raise ValueError('{} is not an installed hook'.format(hook))
+        hooks = list(_hooks)
+        hooks.remove(hook)
+        _hooks = hooks
+
+
+def enabled():
+    return bool(_hooks)
+
+
+class Call(object):
+    '''
+    The measurements of one load or dump.
+
+    path: The path, or the name of the file object when it has one.
+    format: The name of the module which decoded or encoded the file, such
+      as 'json'.
+    mode: The mode the file was opened with.
+    started: When the call started, as a time.time() timestamp.
+    seconds: The duration of the whole call.
+    codec_seconds: The time spent decoding or encoding, excluding the time
+      spent reading from or writing to the file.
+    bytes_read, bytes_written: The number of bytes the decoder read or the
+      encoder wrote. For compressed files this is the uncompressed size.
+    method_counts: How many times each registered JSONEncoder or JSONDecoder
+      method returned a result, by method name.
+    error: The exception which the call raised, or None.
+    '''
+    def __init__(self, path, format, mode): # pylint: disable=redefined-builtin
+        self.path = path
+        self.format = format
+        self.mode = mode
+        self.started = time.time()
+        self.seconds = 0.0
+        self.codec_seconds = 0.0
+        self.bytes_read = 0
+        self.bytes_written = 0
+        self.method_counts = {}
+        self.error = None
+
+    @property
+    def transfer_seconds(self):
+        '''
+        The time spent opening, reading, writing and closing the file,
+        including any download from or upload to s3.
+        '''
+        return self.seconds - self.codec_seconds
+
+    def __repr__(self):
+        return '<Call {} {} {} {:.4f}s>'.format(self.format, self.mode, self.path, self.seconds)
+
+
+def count(method):
+    '''
+    Record that method returned a result in the innermost call on this
+    thread. MethodListCaller calls this when a hook is installed.
+    '''
+    stack = getattr(_local, 'stack', None)
+    if stack:
+        name = getattr(method, '__name__', repr(method))
+        counts = stack[-1].method_counts
+        counts[name] = counts.get(name, 0) + 1
+
+
+def measured_call(opener, path_or_fp, fn, mode, args, kwargs):
+    '''
+    Call opener as ensure_file_open_and_call does, measuring it and fn, and
+    report the result to the hooks.
+    '''
+    record = _start(path_or_fp, fn, mode)
+    def measured_fn(f, *fn_args, **fn_kwargs):
+        counted = CountingFile(f, record)
+        start = time.time()
+        _push(record)
+        try:
+            return fn(counted, *fn_args, **fn_kwargs)
+        finally:
+            _pop()
+            record.codec_seconds += time.time() - start - counted.seconds
+    try:
+        return opener(path_or_fp, measured_fn, mode, args, kwargs)
+    except Exception as e:
+        record.error = e
+        raise
+    finally:
+        _finish(record)
+
+
+def measured_iterate(opener, path_or_fp, fn, mode, args, kwargs):
+    '''
+    Like measured_call, for ensure_file_open_and_iterate. Only the time spent
+    producing each item is counted, not the time the caller spends with it.
+    '''
+    record = _start(path_or_fp, fn, mode)
+    def measured_fn(f, *fn_args, **fn_kwargs):
+        counted = CountingFile(f, record)
+        items = iter(fn(counted, *fn_args, **fn_kwargs))
+        while True:
+            start = time.time()
+            read_seconds = counted.seconds
+            _push(record)
+            try:
+                item = next(items)
+            except StopIteration:
+                return
+            finally:
+                _pop()
+                record.codec_seconds += time.time() - start - (counted.seconds - read_seconds)
+            yield item
+    seconds = 0.0
+    items = opener(path_or_fp, measured_fn, mode, args, kwargs)
+    try:
+        while True:
+            start = time.time()
+            try:
+                item = next(items)
+            except StopIteration:
+                return
+            finally:
+                seconds += time.time() - start
+            yield item
+    except Exception as e:
+        record.error = e
+        raise
+    finally:
+        items.close()
+        record.seconds = seconds
+        _finish(record, measured=False)
+
+
+def _start(path_or_fp, fn, mode):
+    if isinstance(path_or_fp, basestring):
+        path = path_or_fp
+    else:
+        path = getattr(path_or_fp, 'name', None)
+    module = getattr(fn, '__module__', None) or ''
+    if module.startswith('baiji.serialization.'):
+        module = module[len('baiji.serialization.'):]
+    return Call(path, module, mode)
+
+
+def _push(record):
+    # The calls whose decoders or encoders are running on this thread. A
+    # decoder may itself load a file, like the blobs JSONDecoder refers to.
+    if not hasattr(_local, 'stack'):
+        _local.stack = []
+    _local.stack.append(record)
+
+
+def _pop():
+    _local.stack.pop()
+
+
+def _finish(record, measured=True):
+    if measured:
+        record.seconds = time.time() - record.started
+    for hook in _hooks:
+        hook(record)
+
+
+class CountingFile(object):
+    '''
+    Wraps a file object, counting the bytes read from and written to it,
+    and the time spent doing so, into a Call.
+    '''
+    def __init__(self, f, record):
+        self.f = f
+        self.record = record
+        self.seconds = 0.0
+        if hasattr(f, 'readinto'):
+            self.readinto = self._readinto
+
+    def __getattr__(self, name):
+        return getattr(self.f, name)
+
+    def __iter__(self):
+        return self
+
+    def next(self):
+        line = self.readline()
+        if not line:
+            raise StopIteration
+        return line
+
+    __next__ = next
+
+    def read(self, *args):
+        start = time.time()
+        data = self.f.read(*args)
+        self.seconds += time.time() - start
+        self.record.bytes_read += len(data)
+        return data
+
+    def readline(self, *args):
+        start = time.time()
+        line = self.f.readline(*args)
+        self.seconds += time.time() - start
+        self.record.bytes_read += len(line)
+        return line
+
+    def readlines(self, *args):
+        start = time.time()
+        lines = self.f.readlines(*args)
+        self.seconds += time.time() - start
+        self.record.bytes_read += sum(len(line) for line in lines)
+        return lines
+
+    def _readinto(self, buf):
+        start = time.time()
+        count = self.f.readinto(buf)
+        self.seconds += time.time() - start
+        self.record.bytes_read += count or 0
+        return count
+
+    def write(self, data):
+        start = time.time()
+        self.f.write(data)
+        self.seconds += time.time() - start
+        self.record.bytes_written += len(data)
+
+    def writelines(self, lines):
+        for line in lines:
+            self.write(line)
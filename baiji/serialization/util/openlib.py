@@ -1,13 +1,87 @@
+from contextlib import contextmanager
+
 def ensure_file_open_and_call(path_or_fp, fn, mode='r', *args, **kwargs):
+    '''
+    compression: The name of a codec in util.compression.CODECS, such as
+      'gzip', to compress what fn writes or decompress what it reads. By
+      default it's chosen from the suffix of a path, e.g. `foo.json.gz`, and
+      file objects are used as they are. Pass False to turn off detection.
+    '''
+    from baiji.serialization.util import instrumentation
+
+    if instrumentation.enabled():
+        return instrumentation.measured_call(_call, path_or_fp, fn, mode, args, kwargs)
+    return _call(path_or_fp, fn, mode, args, kwargs)
+
+def _call(path_or_fp, fn, mode, args, kwargs):
+    from baiji.serialization.util import cache
+
+    compression = kwargs.pop('compression', None)
+    if cache.applies_to(path_or_fp, mode):
+        return cache.current().call(path_or_fp, fn, mode, compression, args, kwargs)
+    with opened(path_or_fp, mode, compression) as f:
+        return fn(f, *args, **kwargs)
+
+def ensure_file_open_and_iterate(path_or_fp, fn, mode='r', *args, **kwargs):
+    '''
+    Like ensure_file_open_and_call, for a generator function fn. The file is
+    kept open until the returned generator is exhausted or closed.
+    '''
+    if not isinstance(path_or_fp, basestring) and not _is_file_like(path_or_fp):
+        raise ValueError('Object {} does not appear to be a path or a file like object'.format(path_or_fp))
+    from baiji.serialization.util import instrumentation
+
+    if instrumentation.enabled():
+        return instrumentation.measured_iterate(_iterate, path_or_fp, fn, mode, args, kwargs)
+    return _iterate(path_or_fp, fn, mode, args, kwargs)
+
+def _iterate(path_or_fp, fn, mode, args, kwargs):
+    from baiji.serialization.util import cache
+    from baiji.serialization.util.compression import compression_for_path
+
+    compression = kwargs.pop('compression', None)
+    if cache.applies_to(path_or_fp, mode):
+        if compression is None:
+            compression = compression_for_path(path_or_fp) or False
+        path_or_fp = cache.current().fetch(path_or_fp)
+    with opened(path_or_fp, mode, compression) as f:
+        for item in fn(f, *args, **kwargs):
+            yield item
+
+@contextmanager
+def opened(path_or_fp, mode='r', compression=None):
+    '''
+    Context manager which opens a path with s3.open, or passes a file object
+    through, and applies compression as ensure_file_open_and_call does.
+    '''
     from baiji import s3
+    from baiji.serialization.util.compression import compression_for_path
 
     if isinstance(path_or_fp, basestring):
+        if compression is None:
+            compression = compression_for_path(path_or_fp)
+        if compression and 'b' not in mode:
+            mode += 'b'
         with s3.open(path_or_fp, mode) as f:
-            return fn(f, *args, **kwargs)
-    elif isinstance(path_or_fp, file) or (hasattr(path_or_fp, 'read') and hasattr(path_or_fp, 'seek')):
-        result = fn(path_or_fp, *args, **kwargs)
+            with _compressed(f, mode, compression) as wrapped:
+                yield wrapped
+    elif _is_file_like(path_or_fp):
+        with _compressed(path_or_fp, mode, compression) as wrapped:
+            yield wrapped
         if hasattr(path_or_fp, 'flush'):
             path_or_fp.flush()
-        return result
     else:
         raise ValueError('Object {} does not appear to be a path or a file like object'.format(path_or_fp))
+
+@contextmanager
+def _compressed(f, mode, compression):
+    from baiji.serialization.util.compression import CompressedFile
+
+    if not compression:
+        yield f
+    else:
+        with CompressedFile(f, mode, compression) as wrapped:
+            yield wrapped
+
+def _is_file_like(x):
+    return isinstance(x, file) or (hasattr(x, 'read') and hasattr(x, 'seek'))
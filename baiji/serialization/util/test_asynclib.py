@@ -0,0 +1,59 @@
+import unittest
+import os
+from baiji.serialization.util import asynclib
+
+class TestAsynclib(unittest.TestCase):
+
+    def setUp(self):
+        import tempfile
+        self.tmp_dir = tempfile.mkdtemp('baiji-serialization-asynclib')
+
+    def tearDown(self):
+        import shutil
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+        asynclib.set_max_workers(asynclib.DEFAULT_MAX_WORKERS)
+
+    def test_aload_and_adump_round_trip(self):
+        from baiji.serialization import json, yaml, csv, pickle, jsonl
+        cases = [
+            (json, {'foo': [1, 2]}, {'foo': [1, 2]}),
+            (yaml, {'foo': [1, 2]}, {'foo': [1, 2]}),
+            (csv, [['foo'], ['1']], [{'foo': '1'}]),
+            (pickle, {'foo': (1, 2)}, {'foo': (1, 2)}),
+            (jsonl, [{'foo': 1}], [{'foo': 1}]),
+        ]
+        for module, obj, expected in cases:
+            path = os.path.join(self.tmp_dir, 'test' + module.EXTENSION)
+            module.adump(obj, path).result()
+            self.assertEqual(module.aload(path).result(), expected)
+
+    def test_aload_reports_errors_through_the_future(self):
+        from baiji.serialization import json
+        future = json.aload(os.path.join(self.tmp_dir, 'missing.json'))
+        self.assertIsInstance(future.exception(), Exception)
+
+    def test_max_workers_bounds_concurrency(self):
+        import threading
+        import time
+        asynclib.set_max_workers(2)
+        lock = threading.Lock()
+        running = [0, 0] # current, peak
+
+        def work():
+            with lock:
+                running[0] += 1
+                running[1] = max(running)
+            time.sleep(0.01)
+            with lock:
+                running[0] -= 1
+
+        futures = [asynclib.submit(work) for _ in range(10)]
+        for future in futures:
+            future.result()
+        self.assertLessEqual(running[1], 2)
+
+    def test_submit_to_another_executor(self):
+        from concurrent.futures import ThreadPoolExecutor
+        pool = ThreadPoolExecutor(max_workers=1)
+        self.assertEqual(asynclib.submit(sum, [1, 2], executor=pool).result(), 3)
+        pool.shutdown()
@@ -0,0 +1,129 @@
+import unittest
+import os
+
+class FakeS3(object):
+    '''
+    Stands in for the parts of baiji.s3 that the cache uses, serving
+    s3://bucket/key from a local directory.
+    '''
+    def __init__(self, root):
+        self.root = root
+        self.downloads = 0
+
+    def local(self, path):
+        return os.path.join(self.root, path[len('s3://bucket/'):])
+
+    def put(self, path, contents):
+        with open(self.local(path), 'wb') as f:
+            f.write(contents)
+
+    def etag(self, path):
+        import hashlib
+        with open(self.local(path), 'rb') as f:
+            return hashlib.md5(f.read()).hexdigest()
+
+    def cp(self, src, dst, force=False):
+        import shutil
+        self.downloads += 1
+        shutil.copyfile(self.local(src), dst)
+
+class TestRemoteCache(unittest.TestCase):
+
+    def setUp(self):
+        import tempfile
+        from baiji import s3
+        self.tmp_dir = tempfile.mkdtemp('baiji-serialization-cache')
+        os.mkdir(os.path.join(self.tmp_dir, 'remote'))
+        self.s3 = FakeS3(os.path.join(self.tmp_dir, 'remote'))
+        self.original = s3.etag, s3.cp
+        s3.etag, s3.cp = self.s3.etag, self.s3.cp
+
+    def tearDown(self):
+        import shutil
+        from baiji import s3
+        from baiji.serialization.util import cache
+        s3.etag, s3.cp = self.original
+        cache.disable()
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+
+    def test_repeat_loads_are_served_locally(self):
+        from baiji.serialization import json, yaml
+        from baiji.serialization.util import cache
+        cache.enable(os.path.join(self.tmp_dir, 'cache'))
+        self.s3.put('s3://bucket/config.json', '{"foo": 1}')
+        self.s3.put('s3://bucket/config.yaml', 'foo: 2\n')
+        for _ in range(3):
+            self.assertEqual(json.load('s3://bucket/config.json'), {'foo': 1})
+            self.assertEqual(yaml.load('s3://bucket/config.yaml'), {'foo': 2})
+        self.assertEqual(self.s3.downloads, 2)
+
+        # A changed key has a new ETag
+        self.s3.put('s3://bucket/config.json', '{"foo": 3}')
+        self.assertEqual(json.load('s3://bucket/config.json'), {'foo': 3})
+        self.assertEqual(self.s3.downloads, 3)
+
+    def test_compressed_remote_loads(self):
+        from StringIO import StringIO
+        import gzip
+        from baiji.serialization import jsonl
+        from baiji.serialization.util import cache
+        cache.enable(os.path.join(self.tmp_dir, 'cache'))
+        raw = StringIO()
+        with gzip.GzipFile(fileobj=raw, mode='wb') as f:
+            f.write('1\n2\n')
+        self.s3.put('s3://bucket/numbers.jsonl.gz', raw.getvalue())
+        self.assertEqual(jsonl.load('s3://bucket/numbers.jsonl.gz'), [1, 2])
+        self.assertEqual(list(jsonl.iterload('s3://bucket/numbers.jsonl.gz')), [1, 2])
+        self.assertEqual(self.s3.downloads, 1)
+
+    def test_evicts_least_recently_used(self):
+        import time
+        from baiji.serialization import json
+        from baiji.serialization.util import cache
+        cache.enable(os.path.join(self.tmp_dir, 'cache'), max_bytes=250)
+        for name in ['a', 'b', 'c']:
+            self.s3.put('s3://bucket/%s.json' % name, '[%s]' % ', '.join(['0'] * 30))
+        json.load('s3://bucket/a.json')
+        time.sleep(0.01)
+        json.load('s3://bucket/b.json')
+        time.sleep(0.01)
+        json.load('s3://bucket/a.json')
+        time.sleep(0.01)
+        json.load('s3://bucket/c.json') # Evicts b
+        self.assertEqual(self.s3.downloads, 3)
+        json.load('s3://bucket/a.json')
+        self.assertEqual(self.s3.downloads, 3)
+        json.load('s3://bucket/b.json')
+        self.assertEqual(self.s3.downloads, 4)
+
+    def test_memoize(self):
+        from baiji.serialization import json
+        from baiji.serialization.util import cache
+        cache.enable(os.path.join(self.tmp_dir, 'cache'), memoize=10)
+        self.s3.put('s3://bucket/config.json', '{"foo": 1}')
+        first = json.load('s3://bucket/config.json')
+        self.assertIs(json.load('s3://bucket/config.json'), first)
+        self.assertIsNot(json.load('s3://bucket/config.json', use_decimal=True), first)
+
+    def test_local_paths_are_not_cached(self):
+        from baiji.serialization import json
+        from baiji.serialization.util import cache
+        cache.enable(os.path.join(self.tmp_dir, 'cache'))
+        path = os.path.join(self.tmp_dir, 'local.json')
+        json.dump({'foo': 1}, path)
+        self.assertEqual(json.load(path), {'foo': 1})
+        self.assertEqual(os.listdir(os.path.join(self.tmp_dir, 'cache')), [])
+
+    def test_mmap_remote_blob_from_cache(self):
+        import shutil
+        import numpy as np
+        from baiji.serialization import json
+        from baiji.serialization.util import cache
+        cache.enable(os.path.join(self.tmp_dir, 'cache'))
+        local = os.path.join(self.tmp_dir, 'arrays.json')
+        json.dump({'big': np.arange(100)}, local, blob_threshold=0)
+        shutil.copy(local, self.s3.local('s3://bucket/arrays.json'))
+        shutil.copy(local + '.blob', self.s3.local('s3://bucket/arrays.json.blob'))
+        res = json.load('s3://bucket/arrays.json', mmap=True)
+        self.assertIsInstance(res['big'], np.memmap)
+        np.testing.assert_array_equal(res['big'], np.arange(100))
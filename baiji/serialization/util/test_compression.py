@@ -0,0 +1,91 @@
+import unittest
+import os
+
+def _codec_available(compression):
+    from baiji.serialization.util.compression import CODECS
+    try:
+        CODECS[compression]()
+        return True
+    except ImportError:
+        return False
+
+class TestCompression(unittest.TestCase):
+
+    def setUp(self):
+        import tempfile
+        self.tmp_dir = tempfile.mkdtemp('baiji-serialization-compression')
+
+    def tearDown(self):
+        import shutil
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+
+    def test_compression_for_path(self):
+        from baiji.serialization.util.compression import compression_for_path
+        self.assertEqual(compression_for_path('foo.json.gz'), 'gzip')
+        self.assertEqual(compression_for_path('s3://bucket/foo.csv.BZ2'), 'bz2')
+        self.assertEqual(compression_for_path('foo.yaml.xz'), 'xz')
+        self.assertEqual(compression_for_path('foo.pkl.zst'), 'zstd')
+        self.assertIsNone(compression_for_path('foo.json'))
+
+    def test_format_modules_round_trip_compressed_paths(self):
+        from baiji.serialization import json, yaml, csv, pickle
+        for suffix in ['.gz', '.bz2', '.xz', '.zst']:
+            if not _codec_available({'.gz': 'gzip', '.bz2': 'bz2', '.xz': 'xz', '.zst': 'zstd'}[suffix]):
+                continue
+            obj = {'foo': [1, 2, 3] * 1000, 'bar': 'baz'}
+            for module, expected in [
+                    (json, obj),
+                    (yaml, obj),
+                    (pickle, obj),
+                    (csv, [{'foo': str(i), 'bar': 'baz'} for i in range(1000)]),
+            ]:
+                plain_path = os.path.join(self.tmp_dir, 'test' + module.EXTENSION)
+                path = plain_path + suffix
+                for p in [plain_path, path]:
+                    if module is csv:
+                        module.dump([['bar', 'foo']] + [[row['bar'], row['foo']] for row in expected], p)
+                    else:
+                        module.dump(obj, p)
+                self.assertLess(os.path.getsize(path), os.path.getsize(plain_path) / 2)
+                self.assertEqual(module.load(path), expected)
+
+    def test_explicit_compression_with_file_objects(self):
+        from StringIO import StringIO
+        import gzip
+        from baiji.serialization import json
+        io = StringIO()
+        json.dump({'foo': 'bar'}, io, compression='gzip')
+        self.assertEqual(gzip.GzipFile(fileobj=StringIO(io.getvalue())).read(), '{"foo": "bar"}')
+        self.assertEqual(json.load(StringIO(io.getvalue()), compression='gzip'), {'foo': 'bar'})
+
+    def test_compression_false_disables_detection(self):
+        from baiji.serialization import json
+        path = os.path.join(self.tmp_dir, 'plain.json.gz')
+        json.dump({'foo': 'bar'}, path, compression=False)
+        with open(path, 'r') as f:
+            self.assertEqual(f.read(), '{"foo": "bar"}')
+
+    def test_reads_concatenated_streams_line_by_line(self):
+        from StringIO import StringIO
+        import gzip
+        from baiji.serialization import jsonl
+        from baiji.serialization.util import compression
+        raw = StringIO()
+        for i in range(3):
+            member = StringIO()
+            with gzip.GzipFile(fileobj=member, mode='wb') as f:
+                f.write('{"id": %d}\n' % i * 2)
+            raw.write(member.getvalue())
+        original_chunk_size = compression.CHUNK_SIZE
+        compression.CHUNK_SIZE = 5
+        try:
+            self.assertEqual(
+                jsonl.load(StringIO(raw.getvalue()), compression='gzip'),
+                [{'id': 0}, {'id': 0}, {'id': 1}, {'id': 1}, {'id': 2}, {'id': 2}])
+        finally:
+            compression.CHUNK_SIZE = original_chunk_size
+
+    def test_unknown_compression(self):
+        from StringIO import StringIO
+        from baiji.serialization import json
+        self.assertRaises(ValueError, json.load, StringIO('{}'), compression='rar')
@@ -0,0 +1,72 @@
+import unittest
+import os
+from baiji.serialization.util import formatlib
+
+class TestFormatlib(unittest.TestCase):
+
+    def setUp(self):
+        import tempfile
+        self.tmp_dir = tempfile.mkdtemp('baiji-serialization-formatlib')
+
+    def tearDown(self):
+        import shutil
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+
+    def test_module_for_path(self):
+        from baiji.serialization import json, yaml, pickle
+        self.assertIs(formatlib.module_for_path('s3://bucket/foo.json'), json)
+        self.assertIs(formatlib.module_for_path('foo.YML.gz'), yaml)
+        self.assertIs(formatlib.module_for_path('foo.pkl.zst'), pickle)
+        self.assertIs(formatlib.module_for_path('foo.txt', format='json'), json)
+        self.assertRaises(ValueError, formatlib.module_for_path, 'foo.unknown')
+        self.assertRaises(ValueError, formatlib.module_for_path, 'foo.gz')
+
+    def test_load_and_dump_by_extension(self):
+        import baiji.serialization
+        for name, obj in [('a.json', {'a': 1}), ('b.yaml.bz2', [1, 2]), ('c.pkl.gz', (1, 2))]:
+            path = os.path.join(self.tmp_dir, name)
+            baiji.serialization.dump(obj, path)
+            self.assertEqual(baiji.serialization.load(path), obj)
+
+    def test_load_imports_only_the_format_it_needs(self):
+        import subprocess
+        import sys
+        path = os.path.join(self.tmp_dir, 'test.json')
+        with open(path, 'w') as f:
+            f.write('{"foo": 1}')
+        script = '; '.join([
+            'import sys',
+            'import baiji.serialization',
+            'assert baiji.serialization.load(sys.argv[1]) == {"foo": 1}',
+            'print(" ".join(m for m in ["yaml", "numpy", "scipy"] if m in sys.modules))',
+        ])
+        output = subprocess.check_output([sys.executable, '-c', script, path])
+        self.assertEqual(output.strip(), '')
+
+    def test_formats_published_into_the_namespace_are_discovered(self):
+        import sys
+        import baiji.serialization
+        with open(os.path.join(self.tmp_dir, 'fakeformat.py'), 'w') as f:
+            f.write('\n'.join([
+                "EXTENSION = '.fake'",
+                "EXTENSIONS = ['.fk']",
+                "def load(f):",
+                "    return 'loaded ' + f",
+            ]))
+        baiji.serialization.__path__.append(self.tmp_dir)
+        formatlib._discovered = None # pylint: disable=protected-access
+        try:
+            self.assertEqual(formatlib.formats_by_extension()['.fk'], 'fakeformat')
+            self.assertEqual(baiji.serialization.load('foo.fake.gz'), 'loaded foo.fake.gz')
+        finally:
+            baiji.serialization.__path__.remove(self.tmp_dir)
+            formatlib._discovered = None # pylint: disable=protected-access
+            sys.modules.pop('baiji.serialization.fakeformat', None)
+
+    def test_register(self):
+        from baiji.serialization import json
+        formatlib.register('.geojson', 'json')
+        try:
+            self.assertIs(formatlib.module_for_path('foo.geojson'), json)
+        finally:
+            formatlib._registered.pop('.geojson') # pylint: disable=protected-access
@@ -0,0 +1,103 @@
+import unittest
+import os
+from baiji.serialization.util import instrumentation
+
+class TestInstrumentation(unittest.TestCase):
+
+    def setUp(self):
+        import tempfile
+        self.tmp_dir = tempfile.mkdtemp('baiji-serialization-instrumentation')
+        self.calls = []
+        instrumentation.add_hook(self.calls.append)
+
+    def tearDown(self):
+        import shutil
+        if self.calls.append in instrumentation._hooks: # pylint: disable=protected-access
+            instrumentation.remove_hook(self.calls.append)
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+
+    def test_load_and_dump_are_reported(self):
+        import numpy as np
+        from baiji.serialization import json
+        path = os.path.join(self.tmp_dir, 'test.json')
+        obj = {'foo': np.arange(3), 'bar': [np.ones(2), np.zeros(2)]}
+        json.dump(obj, path)
+        loaded = json.load(path)
+        np.testing.assert_array_equal(loaded['foo'], obj['foo'])
+
+        dumped, loaded = self.calls
+        self.assertEqual((dumped.path, dumped.format, dumped.mode), (path, 'json', 'w'))
+        self.assertEqual((loaded.path, loaded.format, loaded.mode), (path, 'json', 'r'))
+        size = os.path.getsize(path)
+        self.assertEqual((dumped.bytes_read, dumped.bytes_written), (0, size))
+        self.assertEqual((loaded.bytes_read, loaded.bytes_written), (size, 0))
+        self.assertEqual(dumped.method_counts, {'encode_numpy': 3})
+        self.assertEqual(loaded.method_counts, {'decode_numpy': 3})
+        for call in self.calls:
+            self.assertIsNone(call.error)
+            self.assertGreater(call.seconds, 0)
+            self.assertGreaterEqual(call.codec_seconds, 0)
+            self.assertGreaterEqual(call.transfer_seconds, 0)
+            self.assertAlmostEqual(call.seconds, call.codec_seconds + call.transfer_seconds)
+
+    def test_compressed_files_report_uncompressed_bytes(self):
+        from baiji.serialization import pickle
+        path = os.path.join(self.tmp_dir, 'test.pkl.gz')
+        pickle.dump('x' * 10000, path)
+        self.assertEqual(pickle.load(path), 'x' * 10000)
+        dumped, loaded = self.calls
+        self.assertEqual(dumped.format, 'pickle')
+        self.assertGreater(dumped.bytes_written, 10000)
+        self.assertGreater(os.path.getsize(path), 0)
+        self.assertLess(os.path.getsize(path), 1000)
+        self.assertEqual(loaded.bytes_read, dumped.bytes_written)
+
+    def test_file_objects_are_reported_by_name(self):
+        from baiji.serialization import yaml
+        path = os.path.join(self.tmp_dir, 'test.yaml')
+        with open(path, 'w') as f:
+            yaml.dump({'foo': 1}, f)
+        self.assertEqual(self.calls[0].path, path)
+        self.assertEqual(self.calls[0].format, 'yaml')
+
+    def test_errors_are_reported(self):
+        from baiji.serialization import json
+        path = os.path.join(self.tmp_dir, 'test.json')
+        with open(path, 'w') as f:
+            f.write('{"foo": ')
+        with self.assertRaises(ValueError):
+            json.load(path)
+        self.assertIsInstance(self.calls[0].error, ValueError)
+
+    def test_iterated_loads_are_reported_when_finished(self):
+        from baiji.serialization import jsonl
+        path = os.path.join(self.tmp_dir, 'test.jsonl')
+        jsonl.dump([{'foo': i} for i in range(5)], path)
+        records = jsonl.iterload(path)
+        next(records)
+        self.assertEqual(len(self.calls), 1)
+        self.assertEqual(len(list(records)), 4)
+        self.assertEqual(len(self.calls), 2)
+        self.assertEqual(self.calls[1].format, 'jsonl')
+        self.assertEqual(self.calls[1].bytes_read, os.path.getsize(path))
+
+    def test_nested_loads_count_their_own_methods(self):
+        import numpy as np
+        from baiji.serialization import json
+        path = os.path.join(self.tmp_dir, 'test.json')
+        json.dump({'foo': np.arange(100)}, path, blob_threshold=1)
+        del self.calls[:]
+        json.load(path)
+        blob, loaded = self.calls
+        self.assertEqual(blob.path, path + json.BLOB_EXTENSION)
+        self.assertEqual(blob.method_counts, {})
+        self.assertEqual(loaded.method_counts, {'decode_ndarray_ref': 1})
+
+    def test_nothing_is_reported_after_the_hook_is_removed(self):
+        from baiji.serialization import json
+        instrumentation.remove_hook(self.calls.append)
+        self.assertFalse(instrumentation.enabled())
+        json.dump({'foo': 1}, os.path.join(self.tmp_dir, 'test.json'))
+        self.assertEqual(self.calls, [])
+        with self.assertRaises(ValueError):
+            instrumentation.remove_hook(self.calls.append)
@@ -2,12 +2,41 @@ from __future__ import absolute_import
 
 EXTENSION = '.yaml'
 
+# Use PyYAML's LibYAML bindings when they're installed. Set to False to
+# force the pure Python loader and dumper. Unsafe dumps always use the pure
+# Python emitter, because LibYAML writes empty tagged scalars such as
+# `!!python/name:...` differently, and that output is relied on.
+#
+# LibYAML is only used to parse and emit. Types, tags and implicit resolvers
+# are always taken from those registered on yaml.SafeLoader, yaml.Loader,
+# yaml.SafeDumper and yaml.Dumper, e.g. with yaml.add_constructor, which the
+# LibYAML classes don't share.
+USE_LIBYAML = True
+
+# Local tags for numpy arrays and scipy.sparse matrices, which are read and
+# written in safe mode
+NDARRAY_TAG = u'!numpy.ndarray'
+SPARSE_TAG = u'!scipy.sparse'
+
+UNSAFE_WARNING = (
+    'Unsafe YAML serialization. This will generate an error in the '
+    'future. Call with `safe=False` if you really want unsafe serialization.')
+
 class SerializationSafetyError(Exception):
     pass
 
-def dump(obj, f, *args, **kwargs):
+def dump(obj, f, **kwargs):
     from baiji.serialization.util.openlib import ensure_file_open_and_call
-    return ensure_file_open_and_call(f, _dump, 'w', obj, *args, **kwargs)
+    return ensure_file_open_and_call(f, _dump, 'w', obj, **kwargs)
+
+
+def adump(obj, f, **kwargs):
+    '''
+    Like dump, but run in the background and return a Future. See
+    baiji.serialization.util.asynclib.
+    '''
+    from baiji.serialization.util.asynclib import submit
+    return submit(dump, obj, f, **kwargs)
 
 
 def load(f, *args, **kwargs):
@@ -15,63 +44,293 @@ def load(f, *args, **kwargs):
     return ensure_file_open_and_call(f, _load, 'r', *args, **kwargs)
 
 
+def aload(f, *args, **kwargs):
+    '''
+    Like load, but run in the background and return a Future. See
+    baiji.serialization.util.asynclib.
+    '''
+    from baiji.serialization.util.asynclib import submit
+    return submit(load, f, *args, **kwargs)
+
+
 def loads(s, *args, **kwargs):
     return _load(s, *args, **kwargs)
 
 
-def dumps(obj, *args, **kwargs):
-    import yaml
+def dumps(obj, stream=None, **kwargs):
+    '''
+    stream: As for yaml.dump, a stream to write to, in which case nothing is
+      returned.
+    '''
+    import warnings
+    result, upgraded = _represent_and_emit(stream, obj, kwargs)
+    if upgraded and kwargs.get('safe') is None:
+        warnings.warn(UNSAFE_WARNING, DeprecationWarning, stacklevel=2)
+    return result
+
+
+def _dump(f, obj, **kwargs):
+    import warnings
+    result, upgraded = _represent_and_emit(f, obj, kwargs)
+    if upgraded and kwargs.get('safe') is None:
+        warnings.warn(UNSAFE_WARNING, DeprecationWarning, stacklevel=2)
+    return result
+
+
+def _load(f, safe=None):
     import warnings
-    safe_mode = kwargs.pop('safe', None)
+    import yaml
+    # Compose once, then construct safely, only upgrading the tags which
+    # need the unsafe constructors when safe allows it. Nothing is parsed
+    # twice, so this works for streams which can only be read once.
+    loader = _loader_class()(f)
+    _use_resolvers(loader, yaml.SafeLoader)
     try:
-        return yaml.safe_dump(obj, *args, **kwargs)
-    except yaml.representer.RepresenterError as e:
-        if safe_mode:
+        node = loader.get_single_node()
+    finally:
+        loader.dispose()
+    if node is None:
+        return None
+    constructor = _upgrading_constructor_class()(safe)
+    try:
+        result = constructor.construct_document(node)
+    except yaml.constructor.ConstructorError as e:
+        if safe:
             raise SerializationSafetyError(*e.args)
-        if safe_mode is None:
-            warnings.warn(
-                ('Unsafe YAML serialization. This will generate an error in the '
-                 'future. Call with `safe=False` if you really want unsafe serialization.'),
-                DeprecationWarning, stacklevel=2
-            )
-        # if safe_mode is None (not given) or False (explicitly set), fall back to unsafe behavior
-        return yaml.dump(obj, *args, **kwargs)
+        raise
+    if constructor.upgraded and safe is None:
+        warnings.warn(UNSAFE_WARNING, DeprecationWarning, stacklevel=2)
+    return result
 
 
+def _represent_and_emit(stream, obj, kwargs):
+    '''
+    Represent obj, and emit it to stream, or to a string which is returned
+    when stream is None. Return the result and whether the unsafe
+    representer was needed.
 
-def _dump(f, obj, *args, **kwargs):
+    PyYAML builds the whole node graph before emitting anything, so when
+    the safe representer fails, only the representation is redone, with
+    the unsafe representer, and the document is emitted once. Redoing all
+    of it keeps the output of unsafe dumps as it's always been, e.g. with
+    tuples and unicode strings tagged throughout.
+
+    kwargs may include binary, to write numeric numpy arrays as base64
+    encoded bytes instead of lists.
+    '''
     import yaml
-    import warnings
-    safe_mode = kwargs.pop('safe', None)
+    kwargs = dict(kwargs)
+    safe = kwargs.pop('safe', None)
+    binary = kwargs.pop('binary', False)
+    kwargs.setdefault('encoding', 'utf-8')
+    style = dict(
+        default_style=kwargs.get('default_style'),
+        default_flow_style=kwargs.get('default_flow_style'))
+    safe_representer, unsafe_representer = _representer_classes()
+    upgraded = False
     try:
-        return yaml.safe_dump(obj, f, *args, **kwargs)
+        node = safe_representer(binary, **style).represent_data(obj)
     except yaml.representer.RepresenterError as e:
-        if safe_mode:
+        if safe:
             raise SerializationSafetyError(*e.args)
-        if safe_mode is None:
-            warnings.warn(
-                ('Unsafe YAML serialization. This will generate an error in the '
-                 'future. Call with `safe=False` if you really want unsafe serialization.'),
-                DeprecationWarning, stacklevel=2
-            )
-        # if safe_mode is None (not given) or False (explicitly set), fall back to unsafe behavior
-        return yaml.dump(obj, f, *args, **kwargs)
+        upgraded = True
+        node = unsafe_representer(binary, **style).represent_data(obj)
 
+    getvalue = None
+    if stream is None:
+        from StringIO import StringIO
+        stream = StringIO()
+        getvalue = stream.getvalue
+    dumper = _dumper_class(safe=not upgraded)(stream, **kwargs)
+    _use_resolvers(dumper, yaml.Dumper if upgraded else yaml.SafeDumper)
+    try:
+        dumper.open()
+        dumper.serialize(node)
+        dumper.close()
+    finally:
+        dumper.dispose()
+    return (getvalue() if getvalue else None), upgraded
 
-def _load(f, *args, **kwargs):
+
+def _loader_class():
+    '''
+    Return the class used to compose YAML documents into nodes.
+    '''
     import yaml
-    import warnings
-    safe_mode = kwargs.pop('safe', None)
-    try:
-        return yaml.safe_load(f, *args, **kwargs)
-    except yaml.constructor.ConstructorError as e:
-        if safe_mode:
-            raise SerializationSafetyError(*e.args)
-        if safe_mode is None:
-            warnings.warn(
-                ('Unsafe YAML serialization. This will generate an error in the '
-                 'future. Call with `safe=False` if you really want unsafe serialization.'),
-                DeprecationWarning, stacklevel=2
-            )
-        # if safe_mode is None (not given) or False (explicitly set), fall back to unsafe behavior
-        return yaml.load(f, *args, **kwargs)
+    if USE_LIBYAML and hasattr(yaml, 'CSafeLoader'):
+        return yaml.CSafeLoader
+    return yaml.SafeLoader
+
+
+def _use_resolvers(instance, cls):
+    '''
+    Have a loader or dumper instance resolve implicit tags with the
+    resolvers registered on cls.
+    '''
+    instance.yaml_implicit_resolvers = cls.yaml_implicit_resolvers
+    instance.yaml_path_resolvers = cls.yaml_path_resolvers
+
+
+def _dumper_class(safe):
+    import yaml
+    if not safe:
+        return yaml.Dumper
+    if USE_LIBYAML and hasattr(yaml, 'CSafeDumper'):
+        return yaml.CSafeDumper
+    return yaml.SafeDumper
+
+
+_upgrading_constructor = None
+
+def _upgrading_constructor_class():
+    '''
+    Return a constructor class which starts with the constructors
+    registered on yaml.SafeLoader. When it meets a tag they don't handle, it
+    raises if safe is true, and otherwise records the upgrade and uses the
+    constructor registered on yaml.Loader for that tag. The safe
+    constructors are the same in both, so the result matches a full unsafe
+    load. The registrations are read by each instance, so later ones are
+    seen.
+
+    It's built on first use, so yaml is only imported when it's needed.
+    '''
+    global _upgrading_constructor # pylint: disable=global-statement
+    if _upgrading_constructor is not None:
+        return _upgrading_constructor
+    import yaml
+    from yaml.constructor import SafeConstructor, Constructor
+
+    class UpgradingConstructor(Constructor):
+        def __init__(self, safe):
+            Constructor.__init__(self)
+            self.safe = safe
+            self.upgraded = False
+            cls = type(self)
+            self.yaml_constructors = dict(yaml.SafeLoader.yaml_constructors)
+            self.yaml_constructors.setdefault(NDARRAY_TAG, cls.construct_ndarray)
+            self.yaml_constructors.setdefault(SPARSE_TAG, cls.construct_sparse)
+            self.yaml_constructors[None] = cls.construct_undefined
+            self.yaml_multi_constructors = yaml.SafeLoader.yaml_multi_constructors
+            self.unsafe_constructors = yaml.Loader.yaml_constructors
+            self.unsafe_multi_constructors = yaml.Loader.yaml_multi_constructors
+
+        def construct_undefined(self, node):
+            if not self.safe:
+                if node.tag in self.unsafe_constructors:
+                    self.upgraded = True
+                    return self.unsafe_constructors[node.tag](self, node)
+                for prefix, multi_constructor in self.unsafe_multi_constructors.items():
+                    if prefix is not None and node.tag.startswith(prefix):
+                        self.upgraded = True
+                        return multi_constructor(self, node.tag[len(prefix):], node)
+            return SafeConstructor.construct_undefined(self, node)
+
+        def construct_ndarray(self, node):
+            import numpy as np
+            value = self.construct_mapping(node, deep=True)
+            dtype = np.dtype(value['dtype'])
+            if 'byteorder' in value:
+                # The binary form
+                dtype = dtype.newbyteorder(value['byteorder'])
+                return np.frombuffer(bytearray(value['data']), dtype=dtype).reshape(value['shape'])
+            if dtype.kind == 'c':
+                # Pairs of real and imaginary parts
+                parts = np.array(value['data'], dtype=np.dtype(dtype.char.lower()))
+                return parts.view(dtype).reshape(value['shape'])
+            return np.array(value['data'], dtype=dtype).reshape(value['shape'])
+
+        def construct_sparse(self, node):
+            from baiji.serialization.json import JSONDecoder
+            value = self.construct_mapping(node, deep=True)
+            value['__scipy.sparse.sparsematrix__'] = True
+            return JSONDecoder().decode_scipy(value)
+
+    _upgrading_constructor = UpgradingConstructor
+    return _upgrading_constructor
+
+
+_representers = None
+
+def _representer_classes():
+    '''
+    Return safe and unsafe representer classes, which use the representers
+    registered on yaml.SafeDumper and yaml.Dumper respectively. They also
+    write numpy arrays and scipy.sparse matrices with NDARRAY_TAG and
+    SPARSE_TAG, and numpy scalars as the equivalent Python builtins.
+
+    Like the constructor, they're built on first use, and the registrations
+    are read by each instance.
+    '''
+    global _representers # pylint: disable=global-statement
+    if _representers is not None:
+        return _representers
+    import sys
+    import yaml
+    from yaml.representer import SafeRepresenter, Representer
+
+    class NumpyRepresenterMixin(object):
+        dumper_class = None
+
+        def __init__(self, binary, default_style=None, default_flow_style=None):
+            super(NumpyRepresenterMixin, self).__init__(
+                default_style=default_style, default_flow_style=default_flow_style)
+            self.binary = binary
+            self.yaml_representers = self.dumper_class.yaml_representers
+            self.yaml_multi_representers = self.dumper_class.yaml_multi_representers
+            # If they haven't been imported, there can't be any numpy or
+            # scipy objects to represent.
+            self.np = sys.modules.get('numpy')
+            self.sp = sys.modules.get('scipy.sparse')
+
+        def represent_data(self, data):
+            # Registered representers come first. Only plain arrays and
+            # scalars of types which round trip through NDARRAY_TAG or a
+            # builtin are claimed; subclasses like masked arrays, and
+            # structured or object arrays, go to the unsafe representers.
+            if self.np is not None and type(data) not in self.yaml_representers:
+                if type(data) is self.np.ndarray and data.dtype.kind in 'biufcSUM':
+                    return self.represent_ndarray(data)
+                if isinstance(data, self.np.generic) and data.dtype.kind in 'biufcSU':
+                    return super(NumpyRepresenterMixin, self).represent_data(data.item())
+            if self.sp is not None and self.sp.issparse(data):
+                return self.represent_sparse(data)
+            return super(NumpyRepresenterMixin, self).represent_data(data)
+
+        def represent_ndarray(self, data):
+            import base64
+            # Names like string24 can't be parsed back, so use codes for
+            # anything but numbers
+            value = [
+                ('dtype', data.dtype.name if data.dtype.kind in 'biufc' else data.dtype.str),
+                ('shape', list(data.shape)),
+            ]
+            if self.binary and data.dtype.kind in 'biufc':
+                value.append(('byteorder', data.dtype.str[0]))
+                node = self.represent_mapping(NDARRAY_TAG, value)
+                node.value.append((self.represent_data('data'), self.represent_scalar(
+                    u'tag:yaml.org,2002:binary',
+                    unicode(base64.encodestring(self.np.ascontiguousarray(data).tobytes())),
+                    style='|')))
+                return node
+            if data.dtype.kind == 'c':
+                # Safe YAML has no complex numbers, so write each as a pair of
+                # its real and imaginary parts
+                data = self.np.stack([data.real, data.imag], axis=-1)
+            value.append(('data', data.tolist()))
+            return self.represent_mapping(NDARRAY_TAG, value)
+
+        def represent_sparse(self, data):
+            from baiji.serialization.json import JSONEncoder
+            value = JSONEncoder().encode_scipy(data)
+            del value['__scipy.sparse.sparsematrix__']
+            value['shape'] = list(value['shape'])
+            return self.represent_mapping(SPARSE_TAG, sorted(value.items()))
+
+    class SafeNumpyRepresenter(NumpyRepresenterMixin, SafeRepresenter):
+        dumper_class = yaml.SafeDumper
+
+    class NumpyRepresenter(NumpyRepresenterMixin, Representer):
+        dumper_class = yaml.Dumper
+
+    _representers = SafeNumpyRepresenter, NumpyRepresenter
+    return _representers
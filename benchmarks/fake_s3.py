@@ -0,0 +1,65 @@
+'''
+An in-process stand-in for the parts of baiji.s3 which the serialization
+modules use, so benchmarks of s3:// paths measure this package rather than
+the network. Keys are kept in memory.
+'''
+import io
+import time
+
+
+class FakeS3(object):
+    def __init__(self, latency=0.0):
+        '''
+        latency: Seconds to wait on each open, and on each close of a
+          written key, to approximate a round trip.
+        '''
+        self.latency = latency
+        self.keys = {}
+        self.original = None
+
+    def install(self):
+        from baiji import s3
+        self.original = s3.open, s3.etag, s3.cp
+        s3.open, s3.etag, s3.cp = self.open, self.etag, self.cp
+
+    def uninstall(self):
+        from baiji import s3
+        s3.open, s3.etag, s3.cp = self.original
+
+    def __enter__(self):
+        self.install()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.uninstall()
+
+    def open(self, key, mode='rb', version_id=None): # pylint: disable=redefined-builtin, unused-argument
+        time.sleep(self.latency)
+        if 'r' in mode:
+            if key not in self.keys:
+                raise IOError('No such key {}'.format(key))
+            return _FakeKey(self, key, self.keys[key], writing=False)
+        return _FakeKey(self, key, '', writing=True)
+
+    def etag(self, key):
+        import hashlib
+        return hashlib.md5(self.keys[key]).hexdigest()
+
+    def cp(self, src, dst, force=False): # pylint: disable=unused-argument
+        time.sleep(self.latency)
+        with open(dst, 'wb') as f:
+            f.write(self.keys[src])
+
+
+class _FakeKey(io.BytesIO):
+    def __init__(self, s3, key, contents, writing):
+        io.BytesIO.__init__(self, contents)
+        self.s3 = s3
+        self.name = key
+        self.writing = writing
+
+    def close(self):
+        if self.writing and not self.closed:
+            time.sleep(self.s3.latency)
+            self.s3.keys[self.name] = self.getvalue()
+        io.BytesIO.close(self)
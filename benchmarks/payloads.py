@@ -0,0 +1,38 @@
+'''
+Payloads for the benchmarks. Each builder takes a scale, where 1.0 gives a
+payload of roughly production size, and is deterministic.
+'''
+
+# The modules which each builder's payload needs, which loading it would
+# otherwise import
+MODULES = {
+    'large_ndarray': ['numpy'],
+    'sparse_matrix': ['numpy', 'scipy.sparse'],
+}
+
+
+def large_ndarray(scale):
+    import numpy as np
+    return {'verts': np.random.RandomState(0).rand(int(1000000 * scale), 3)}
+
+
+def sparse_matrix(scale):
+    import scipy.sparse as sp
+    rows = int(100000 * scale)
+    return {'matrix': sp.random(rows, 1000, density=0.001, format='csr', random_state=0)}
+
+
+def small_dicts(scale):
+    return [
+        {'id': i, 'name': 'item{}'.format(i), 'value': i * 0.5, 'tags': ['a', 'b'], 'active': i % 2 == 0}
+        for i in xrange(int(1000000 * scale))
+    ]
+
+
+def wide_csv(scale):
+    columns = 200
+    header = ['column_{}'.format(j) for j in range(columns)]
+    return [header] + [
+        [str(i * columns + j) for j in range(columns)]
+        for i in xrange(int(20000 * scale))
+    ]
@@ -0,0 +1,292 @@
+'''
+Benchmarks the load, dump, loads and dumps of each format on realistic
+payloads, against local files or an in-process fake of baiji.s3.
+
+    python benchmarks/run.py
+    python benchmarks/run.py --cases json --scale 0.1 --storage s3
+    python benchmarks/run.py --output baseline.json
+    python benchmarks/run.py --baseline baseline.json
+
+Each case and operation runs in its own process, so its peak RSS can be
+measured. For loads, the input is written by a separate setup process, so
+the measured process holds nothing but the serialized input and the
+modules the payload needs before it loads. The results report throughput, the p50, p95 and p99 latency of
+the repeats, and the peak RSS, along with how much of it was added by the
+operation itself. Compared against a baseline, a case whose p50 or added
+RSS grew by more than the tolerance is reported as a regression, and the
+exit status is nonzero.
+'''
+import math
+import os
+import sys
+
+OPERATIONS = ['dumps', 'loads', 'dump', 'load']
+LOAD_OPERATIONS = ['loads', 'load']
+
+# (name, format module, payload builder, scale relative to --scale, dump
+# keyword arguments)
+CASES = [
+    ('json-ndarray', 'json', 'large_ndarray', 0.1, {}),
+    ('json-ndarray-binary', 'json', 'large_ndarray', 1.0, {'binary': True}),
+    ('json-sparse', 'json', 'sparse_matrix', 0.1, {}),
+    ('json-small-dicts', 'json', 'small_dicts', 0.1, {}),
+    ('jsonl-small-dicts', 'jsonl', 'small_dicts', 0.1, {}),
+    ('bjson-ndarray', 'bjson', 'large_ndarray', 1.0, {}),
+    ('bjson-small-dicts', 'bjson', 'small_dicts', 0.1, {}),
+    ('yaml-ndarray', 'yaml', 'large_ndarray', 0.01, {}),
+    ('yaml-small-dicts', 'yaml', 'small_dicts', 0.01, {}),
+    ('csv-wide', 'csv', 'wide_csv', 1.0, {}),
+    ('pickle-ndarray', 'pickle', 'large_ndarray', 1.0, {}),
+    ('pickle-ndarray-out-of-band', 'pickle', 'large_ndarray', 1.0, {'out_of_band': True}),
+    ('pickle-sparse', 'pickle', 'sparse_matrix', 1.0, {}),
+    ('pickle-small-dicts', 'pickle', 'small_dicts', 0.1, {}),
+]
+
+
+def main():
+    import argparse
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--cases', nargs='*', help='Run only the cases whose names contain one of these')
+    parser.add_argument('--operations', nargs='*', choices=OPERATIONS, default=OPERATIONS)
+    parser.add_argument('--storage', choices=['local', 's3'], default='local')
+    parser.add_argument('--s3-latency', type=float, default=0.0, help='Seconds per fake s3 round trip')
+    parser.add_argument('--scale', type=float, default=1.0, help='Multiplies the size of every payload')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--output', help='Write the results to this JSON file')
+    parser.add_argument('--baseline', help='Compare the results with this JSON file')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='The relative slowdown counted as a regression')
+    parser.add_argument('--child', nargs=2, metavar=('CASE', 'OPERATION'), help=argparse.SUPPRESS)
+    parser.add_argument('--setup', metavar='CASE', help=argparse.SUPPRESS)
+    parser.add_argument('--data-dir', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.setup:
+        return run_setup(args.setup, args)
+    if args.child:
+        return run_child(args.child[0], args.child[1], args)
+
+    results = {}
+    for name, _, _, _, _ in CASES:
+        if args.cases and not any(pattern in name for pattern in args.cases):
+            continue
+        for operation in args.operations:
+            result = run_in_subprocess(name, operation, args)
+            results['{} {}'.format(name, operation)] = result
+            print_result(name, operation, result)
+
+    if args.output:
+        import json
+        with open(args.output, 'w') as f:
+            json.dump({'storage': args.storage, 'scale': args.scale, 'results': results}, f, indent=2, sort_keys=True)
+    if args.baseline:
+        return compare(results, args.baseline, args.tolerance)
+    return 0
+
+
+def run_in_subprocess(name, operation, args):
+    import json
+    import shutil
+    import subprocess
+    import tempfile
+    command = [
+        sys.executable, os.path.abspath(__file__),
+        '--storage', args.storage, '--s3-latency', str(args.s3_latency),
+        '--scale', str(args.scale), '--repeat', str(args.repeat),
+    ]
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.pathsep.join(filter(None, [repo_root(), env.get('PYTHONPATH')]))
+    data_dir = tempfile.mkdtemp('baiji-serialization-benchmarks')
+    try:
+        command += ['--data-dir', data_dir]
+        if operation in LOAD_OPERATIONS:
+            subprocess.check_call(command + ['--setup', name], env=env)
+        output = subprocess.check_output(command + ['--child', name, operation], env=env)
+    finally:
+        shutil.rmtree(data_dir, ignore_errors=True)
+    result = json.loads(output.splitlines()[-1])
+    result.update(summarize(result.pop('times'), result['bytes']))
+    return result
+
+
+def find_case(name):
+    from baiji.serialization.util.importlib import module_from_str
+    _, format_name, builder, case_scale, kwargs = [case for case in CASES if case[0] == name][0]
+    return module_from_str('baiji.serialization.' + format_name), builder, case_scale, kwargs
+
+
+def run_setup(name, args):
+    '''
+    Write the inputs of the load operations to args.data_dir: the
+    serialized payload, and a file to load it from.
+    '''
+    import payloads
+    module, builder, case_scale, kwargs = find_case(name)
+    payload = getattr(payloads, builder)(args.scale * case_scale)
+    with open(os.path.join(args.data_dir, 'dumped'), 'wb') as f:
+        f.write(dumps(module, payload, kwargs))
+    module.dump(payload, os.path.join(args.data_dir, 'payload' + module.EXTENSION), **kwargs)
+    return 0
+
+
+def run_child(name, operation, args):
+    '''
+    Run the operation args.repeat times, and print the timings and memory
+    use as JSON. Dumps build their payload first. Loads only read the input
+    run_setup wrote and import the modules the payload needs, so the RSS
+    they add is what loading takes.
+    '''
+    import json
+    import time
+
+    module, builder, case_scale, kwargs = find_case(name)
+    local_path = os.path.join(args.data_dir, 'payload' + module.EXTENSION)
+    fake_s3 = None
+    if args.storage == 's3':
+        from fake_s3 import FakeS3
+        fake_s3 = FakeS3(latency=args.s3_latency)
+        fake_s3.install()
+        path = 's3://benchmarks/payload' + module.EXTENSION
+    else:
+        path = local_path
+
+    try:
+        import payloads
+        # Import these before taking the baseline, so loads are measured
+        # without the time and memory of importing them
+        for module_name in payloads.MODULES.get(builder, []):
+            __import__(module_name)
+        payload = dumped = None
+        if operation in LOAD_OPERATIONS:
+            if operation == 'loads':
+                with open(os.path.join(args.data_dir, 'dumped'), 'rb') as f:
+                    dumped = f.read()
+                size = len(dumped)
+            else:
+                size = os.path.getsize(local_path)
+                if fake_s3 is not None:
+                    with open(local_path, 'rb') as f:
+                        fake_s3.keys[path] = f.read()
+        else:
+            payload = getattr(payloads, builder)(args.scale * case_scale)
+        call = make_call(operation, module, payload, dumped, path, kwargs)
+        del payload
+        rss_before = peak_rss()
+        times = []
+        for _ in range(args.repeat):
+            start = time.time()
+            result = call()
+            times.append(time.time() - start)
+            if operation == 'dumps':
+                size = len(result)
+            del result
+        peak = peak_rss()
+        if operation == 'dump':
+            size = len(fake_s3.keys[path]) if fake_s3 is not None else os.path.getsize(path)
+        print json.dumps({
+            'times': times,
+            'bytes': size,
+            'peak_rss': peak,
+            'added_rss': peak - rss_before,
+        })
+    finally:
+        if fake_s3 is not None:
+            fake_s3.uninstall()
+    return 0
+
+
+def make_call(operation, module, payload, dumped, path, kwargs):
+    if operation == 'dumps':
+        return lambda: dumps(module, payload, kwargs)
+    if operation == 'dump':
+        return lambda: module.dump(payload, path, **kwargs)
+    if operation == 'loads':
+        return lambda: loads(module, dumped)
+    return lambda: module.load(path)
+
+
+def dumps(module, payload, kwargs):
+    if module.__name__.endswith('.pickle'):
+        # pickle.dumps takes no options, so frame it as dump would
+        from cStringIO import StringIO
+        output = StringIO()
+        module._dump(output, payload, **kwargs) # pylint: disable=protected-access
+        return output.getvalue()
+    return module.dumps(payload, **kwargs)
+
+
+def loads(module, dumped):
+    if not hasattr(module, 'loads'):
+        # csv has no loads, so read it as load would
+        from cStringIO import StringIO
+        return module._load(StringIO(dumped)) # pylint: disable=protected-access
+    return module.loads(dumped)
+
+
+def peak_rss():
+    '''
+    Return the peak resident set size of this process, in bytes.
+    '''
+    import resource
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, and OS X bytes
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def percentile(sorted_values, fraction):
+    # Nearest rank
+    index = max(0, int(math.ceil(fraction * len(sorted_values))) - 1)
+    return sorted_values[index]
+
+
+def summarize(times, size):
+    times = sorted(times)
+    p50 = percentile(times, 0.5)
+    return {
+        'p50': p50,
+        'p95': percentile(times, 0.95),
+        'p99': percentile(times, 0.99),
+        'mb_per_second': size / p50 / 1e6 if p50 else None,
+    }
+
+
+def print_result(name, operation, result):
+    print '{:<32} {:<6} {:>9.1f} MB/s  p50 {:>8.4f}s  p95 {:>8.4f}s  p99 {:>8.4f}s  peak {:>7.1f} MB  added {:>7.1f} MB'.format(
+        name, operation, result['mb_per_second'] or 0, result['p50'], result['p95'], result['p99'],
+        result['peak_rss'] / 1e6, result['added_rss'] / 1e6)
+    sys.stdout.flush()
+
+
+def compare(results, baseline_path, tolerance):
+    '''
+    Print the cases which regressed against the baseline, and return the
+    exit status.
+    '''
+    import json
+    with open(baseline_path) as f:
+        baseline = json.load(f)['results']
+    regressions = []
+    for key, result in sorted(results.items()):
+        if key not in baseline:
+            continue
+        for measure in ('p50', 'added_rss'):
+            before, after = baseline[key][measure], result[measure]
+            # Ignore changes in memory smaller than a megabyte, which are noise
+            if measure == 'added_rss' and after - before < 1e6:
+                continue
+            if before and after > before * (1 + tolerance):
+                regressions.append('{} {}: {:.4g} -> {:.4g} ({:+.0%})'.format(key, measure, before, after, after / before - 1))
+    if regressions:
+        print '\nRegressions against {}:'.format(baseline_path)
+        for regression in regressions:
+            print '  ' + regression
+        return 1
+    print '\nNo regressions against {}'.format(baseline_path)
+    return 0
+
+
+def repo_root():
+    return os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+if __name__ == '__main__':
+    sys.exit(main())